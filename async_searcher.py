@@ -0,0 +1,255 @@
+'''
+asyncio front end for yt_searcher
+
+the blocking yt_searcher functions run on thread pools and come back as
+awaitables, so one event loop can keep hundreds of searches and metadata
+lookups in flight
+
+    results = await async_search("lofi", timeout=20)
+    job = async_download(url, "mp3", "Downloads_ytdlp", timeout=600)
+    async for event in job.events():
+        ...
+    path = await job
+
+yt-dlp can not be interrupted in the middle of an extraction, so a
+cancelled or timed out search keeps its worker thread until yt-dlp
+returns and the result is thrown away. downloads really stop, through the
+same progress bus cancellation the download queue uses
+'''
+import asyncio
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from download_scheduler import default_max_workers
+from progress import progress_bus
+from queue_manager import queue_actions
+import yt_searcher
+
+# threads for searches/metadata and for downloads, read when the pools are first used
+lookup_max_workers = 32
+download_max_workers = default_max_workers
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+_job_ids = itertools.count(1)
+
+
+def _executor(kind):
+    # one pool per kind for the whole process, like get_scheduler()
+    with _executors_lock:
+        if kind not in _executors:
+            max_workers = lookup_max_workers if kind == "lookup" else download_max_workers
+            _executors[kind] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"async-{kind}")
+        return _executors[kind]
+
+
+def shutdown_executors(wait=True):
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=wait)
+
+
+async def _lookup(func, *args, timeout=None):
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_executor("lookup"), lambda: func(*args))
+    return await asyncio.wait_for(future, timeout)
+
+
+async def async_search(query, max_results=10, use_cache=True, timeout=None):
+    return await _lookup(yt_searcher.search_youtube, query, max_results, use_cache, timeout=timeout)
+
+
+async def async_video_info(url_link, timeout=None):
+    return await _lookup(yt_searcher.get_video_info, url_link, timeout=timeout)
+
+
+async def async_video_title(url_link, timeout=None):
+    return await _lookup(yt_searcher.get_video_title, url_link, timeout=timeout)
+
+
+async def async_video_formats(url_link, timeout=None):
+    return await _lookup(yt_searcher.get_video_formats, url_link, timeout=timeout)
+
+
+class AsyncDownload():
+    '''
+    one download running on the download pool, await it for the result
+
+    cancel(), a timeout, or cancelling whatever awaits it all stop the
+    download at its next progress report. a job that has not started yet
+    never starts. events() yields the progress events of the job (and of
+    its playlist items) on the event loop
+    '''
+    def __init__(self, searcher, action, timeout=None):
+        if action not in queue_actions.values():
+            raise ValueError(f"Unknown download action: {action}")
+
+        self.searcher = searcher
+        self.action = action
+        self.job_key = searcher.job_key
+        self.timeout = timeout
+        self._loop = asyncio.get_running_loop()
+        self._lock = threading.Lock()
+        self._finished = False
+
+        self._future = _executor("download").submit(self._run)
+        wrapped = asyncio.wrap_future(self._future, loop=self._loop)
+        wrapped.add_done_callback(lambda done: done.cancelled() and self._stop())
+        self._task = self._loop.create_task(asyncio.wait_for(wrapped, timeout))
+        # a task cancelled before its first step never awaits wrapped, so the callback above never runs
+        self._task.add_done_callback(lambda done: done.cancelled() and self._stop())
+
+    def _run(self):
+        try:
+            return getattr(self.searcher, self.action)()
+        finally:
+            # the key may be used again by a later download
+            with self._lock:
+                self._finished = True
+                progress_bus.uncancel(self.job_key)
+
+    def _stop(self):
+        with self._lock:
+            if not self._finished and not self._future.cancel():
+                progress_bus.cancel(self.job_key)
+
+    def cancel(self):
+        self._stop()
+        self._task.cancel()
+
+    def cancelled(self):
+        return self._task.cancelled()
+
+    def done(self):
+        return self._task.done()
+
+    def result(self):
+        return self._task.result()
+
+    def latest_progress(self):
+        return progress_bus.latest(self.job_key)
+
+    def __await__(self):
+        return self._task.__await__()
+
+    async def events(self):
+        queue = asyncio.Queue()
+
+        def on_event(event):
+            if event.get('job') == self.job_key or event.get('parent') == self.job_key:
+                self._loop.call_soon_threadsafe(queue.put_nowait, event)
+
+        subscription = progress_bus.subscribe(on_event)
+        try:
+            while not self._task.done() or not queue.empty():
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait((getter, self._task), return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+        finally:
+            progress_bus.unsubscribe(subscription)
+
+
+def async_download(url_link, kind="mp3", output_dir=None, timeout=None, job_key=None, **options):
+    '''
+    starts a download and returns its AsyncDownload, kind is one of the
+    queue kinds (mp3, audio, mp4, playlist-mp3, playlist-audio, playlist-mp4),
+    options are the yt_search transfer options (ratelimit, video_format, ...)
+
+    must be called with an event loop running
+    '''
+    if kind not in queue_actions:
+        raise ValueError(f"Unknown download kind: {kind}")
+
+    searcher = yt_searcher.yt_search(url=url_link, path=output_dir,
+                                     job_key=job_key or f"async:{next(_job_ids)}", **options)
+    return AsyncDownload(searcher, queue_actions[kind], timeout=timeout)
+
+
+class AsyncYtSearch():
+    '''
+    the async twin of yt_search, nothing is fetched until it is awaited
+
+        searcher = AsyncYtSearch(query="lofi")
+        results = await searcher.get_results()
+
+    the download methods return an AsyncDownload right away, every one of
+    them has its own job key (job_key:1, job_key:2, ...) so cancelling one
+    leaves the others alone
+    '''
+    def __init__(self, query=None, url=None, title=None, path=None, timeout=None,
+                 concurrent_fragments=None, resumable=None, job_key=None, ratelimit=None, video_format=None):
+        self.query = query
+        self.url = url
+        self.title = title
+        self.path = path
+
+        # seconds for each search/lookup, downloads take theirs per call
+        self.timeout = timeout
+
+        self.transfer_options = {
+            'concurrent_fragments': concurrent_fragments,
+            'resumable': resumable,
+            'ratelimit': ratelimit,
+            'video_format': video_format,
+        }
+        self.job_key = job_key or f"async:{next(_job_ids)}"
+        self._download_ids = itertools.count(1)
+        self.last_download = None
+        self.results = None
+
+    async def get_results(self):
+        if self.results is None and self.query:
+            self.results = await async_search(self.query, timeout=self.timeout)
+        return self.results
+
+    async def get_title(self):
+        if self.title is None and self.url:
+            self.title = await async_video_title(self.url, timeout=self.timeout)
+        return self.title
+
+    async def get_info(self):
+        return await async_video_info(self.url, timeout=self.timeout)
+
+    async def get_formats(self):
+        return await async_video_formats(self.url, timeout=self.timeout)
+
+    def latest_progress(self):
+        # of the download started last
+        if self.last_download is None:
+            return None
+        return self.last_download.latest_progress()
+
+    def download(self, kind, timeout=None):
+        if kind not in queue_actions:
+            raise ValueError(f"Unknown download kind: {kind}")
+
+        searcher = yt_searcher.yt_search(url=self.url, title=self.title, path=self.path,
+                                         job_key=f"{self.job_key}:{next(self._download_ids)}",
+                                         **self.transfer_options)
+        self.last_download = AsyncDownload(searcher, queue_actions[kind], timeout=timeout)
+        return self.last_download
+
+    def download_mp3(self, timeout=None):
+        return self.download("mp3", timeout)
+
+    def download_original_audio(self, timeout=None):
+        return self.download("audio", timeout)
+
+    def download_mp4(self, timeout=None):
+        return self.download("mp4", timeout)
+
+    def download_playlist_link_to_mp3(self, timeout=None):
+        return self.download("playlist-mp3", timeout)
+
+    def download_playlist_link_to_audio(self, timeout=None):
+        return self.download("playlist-audio", timeout)
+
+    def download_playlist_link_to_mp4(self, timeout=None):
+        return self.download("playlist-mp4", timeout)
@@ -0,0 +1,409 @@
+'''
+measures the hot paths (search, metadata, downloads, thumbnails) against a
+local web server instead of youtube
+
+the server hands out fake media, an RSS feed that yt-dlp's generic extractor
+reads as a playlist, and JPEG thumbnails. every case runs in a fresh python
+process so its peak RSS is its own
+
+    python benchmarks/hot_paths_benchmark.py --iterations 20
+    python benchmarks/hot_paths_benchmark.py --save baseline.json
+    python benchmarks/hot_paths_benchmark.py --baseline baseline.json
+
+with --baseline the exit code is 1 when a case got slower than the
+tolerance allows. youtube search itself can not be served locally, the
+search cases cover the search cache unless --network is given
+'''
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import urlparse, parse_qs
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+all_cases = (
+    "extract_video_info",
+    "search_memory_hit",
+    "search_disk_hit",
+    "search_live",
+    "get_video_title_cold",
+    "get_video_title_warm",
+    "download_video",
+    "download_audio",
+    "download_playlist",
+    "thumbnail_single",
+    "thumbnail_batch",
+)
+
+# cases that need youtube itself
+network_cases = ("search_live",)
+
+playlist_items = 5
+thumbnail_batch_size = 50
+thumbnail_size = (560, 315)
+
+
+# ---- the local stand-in ----
+
+def make_media(work_dir, media_size):
+    '''
+    real media when ffmpeg is around (the audio case needs it), otherwise
+    files of zeros, yt-dlp downloads those all the same
+    '''
+    media = {}
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg:
+        video_path = os.path.join(work_dir, "video.mp4")
+        audio_path = os.path.join(work_dir, "audio.m4a")
+        subprocess.run([ffmpeg, "-y", "-loglevel", "error",
+                        "-f", "lavfi", "-i", "testsrc=duration=10:size=640x360:rate=30",
+                        "-f", "lavfi", "-i", "sine=duration=10",
+                        "-c:v", "libx264", "-c:a", "aac", "-shortest", video_path], check=True)
+        subprocess.run([ffmpeg, "-y", "-loglevel", "error",
+                        "-f", "lavfi", "-i", "sine=duration=60",
+                        "-c:a", "aac", "-b:a", "128k", audio_path], check=True)
+        with open(video_path, "rb") as f:
+            media["/media/video.mp4"] = ("video/mp4", f.read())
+        with open(audio_path, "rb") as f:
+            media["/media/audio.m4a"] = ("audio/mp4", f.read())
+    else:
+        media["/media/video.mp4"] = ("video/mp4", bytes(media_size))
+        media["/media/audio.m4a"] = ("audio/mp4", bytes(media_size // 4))
+
+    return media, bool(ffmpeg)
+
+
+def make_thumbnail():
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    img = Image.new("RGB", (480, 360))
+    # some detail so the JPEG is not trivially small
+    img.putdata([((x * 7) % 256, (y * 3) % 256, (x * y) % 256) for y in range(360) for x in range(480)])
+    buffer = BytesIO()
+    img.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def playlist_feed(base_url, run):
+    # every item gets its own file name, yt-dlp takes the title and id of direct media from it
+    items = "".join(
+        f"<item><title>Benchmark item {n}</title>"
+        f"<link>{base_url}/media/items/item-{run}-{n}.mp4</link>"
+        f"<guid>item-{run}-{n}</guid></item>"
+        for n in range(1, playlist_items + 1))
+    return (f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+            f"<title>Benchmark playlist {run}</title><link>{base_url}/</link>"
+            f"<description>local benchmark feed</description>{items}</channel></rss>").encode("utf-8")
+
+
+def start_server(media, thumbnail):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def send_body(self, content_type, body):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            if parsed.path in media:
+                self.send_body(*media[parsed.path])
+            elif parsed.path.startswith("/media/items/"):
+                # playlist items, the same video under a different name
+                self.send_body(*media["/media/video.mp4"])
+            elif parsed.path == "/playlist/feed.xml":
+                run = parse_qs(parsed.query).get("run", ["0"])[0]
+                base_url = f"http://{self.headers.get('Host')}"
+                self.send_body("application/rss+xml", playlist_feed(base_url, run))
+            elif parsed.path.startswith("/thumbnails/") and thumbnail is not None:
+                self.send_body("image/jpeg", thumbnail)
+            else:
+                self.send_error(404)
+
+        do_HEAD = do_GET
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, name="benchmark-server", daemon=True).start()
+    return server
+
+
+# ---- the cases, each one runs in its own process ----
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            if not name.endswith(".sqlite3"):
+                total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def timed(func):
+    start = time.perf_counter()
+    ok = func()
+    return time.perf_counter() - start, ok
+
+
+def fake_search_entries(count):
+    return [{
+        'id': f"video{n:05d}",
+        'url': f"https://www.youtube.com/watch?v=video{n:05d}",
+        'title': f"Benchmark video number {n}",
+        'channel': "Benchmark channel",
+        'thumbnails': [{'url': f"https://i.ytimg.com/vi/video{n:05d}/hq720.jpg"}],
+    } for n in range(count)]
+
+
+def run_case(case, base_url, iterations, work_dir, audio_mode):
+    sys.path.insert(0, repo_dir)
+    import yt_searcher
+    from caches import SearchCache
+
+    # the benchmark never touches the real caches or downloads
+    yt_searcher.search_cache = SearchCache(disk_dir=os.path.join(work_dir, "search_cache"))
+
+    latencies = []
+    errors = []
+    transferred = 0
+    operations = 0
+    wall_start = time.perf_counter()
+
+    def record(elapsed, ok, size=0, count=1):
+        nonlocal transferred, operations
+        latencies.append(elapsed)
+        transferred += size
+        operations += count
+        if not ok:
+            errors.append(f"iteration {len(latencies)} failed")
+
+    if case == "extract_video_info":
+        entries = fake_search_entries(1000)
+        for _ in range(iterations):
+            elapsed, ok = timed(lambda: yt_searcher.extract_video_info(entries))
+            record(elapsed, ok, count=len(entries))
+
+    elif case in ("search_memory_hit", "search_disk_hit"):
+        entries = yt_searcher.extract_video_info(fake_search_entries(10))
+        yt_searcher.search_cache.put("benchmark query", 10, entries)
+        for _ in range(iterations):
+            if case == "search_disk_hit":
+                yt_searcher.search_cache.memory.clear()
+            elapsed, ok = timed(lambda: yt_searcher.search_youtube("benchmark query"))
+            record(elapsed, ok)
+
+    elif case == "search_live":
+        for i in range(iterations):
+            elapsed, ok = timed(lambda: yt_searcher.search_youtube(f"benchmark {i}", use_cache=False))
+            record(elapsed, ok)
+
+    elif case == "get_video_title_cold":
+        for i in range(iterations):
+            url = f"{base_url}/media/video.mp4?title={i}"
+            elapsed, ok = timed(lambda: yt_searcher.get_video_title(url) != 'Unknown_Title')
+            record(elapsed, ok)
+
+    elif case == "get_video_title_warm":
+        url = f"{base_url}/media/video.mp4?title=warm"
+        yt_searcher.get_video_title(url)
+        for _ in range(iterations):
+            elapsed, ok = timed(lambda: yt_searcher.get_video_title(url) != 'Unknown_Title')
+            record(elapsed, ok)
+
+    elif case == "download_video":
+        for i in range(iterations):
+            output_dir = os.path.join(work_dir, f"video-{i}")
+            url = f"{base_url}/media/video.mp4?run={i}"
+            elapsed, ok = timed(lambda: yt_searcher.download_video(url, output_dir, video_format="best"))
+            record(elapsed, ok, directory_size(output_dir))
+
+    elif case == "download_audio":
+        for i in range(iterations):
+            output_dir = os.path.join(work_dir, f"audio-{i}")
+            url = f"{base_url}/media/audio.m4a?run={i}"
+            elapsed, ok = timed(lambda: yt_searcher.download_audio(url, output_dir, audio_mode=audio_mode))
+            record(elapsed, ok, directory_size(output_dir))
+
+    elif case == "download_playlist":
+        for i in range(iterations):
+            output_dir = os.path.join(work_dir, f"playlist-{i}")
+            url = f"{base_url}/playlist/feed.xml?run={i}"
+            elapsed, report = timed(lambda: yt_searcher.download_playlist(url, output_dir, video_format="best"))
+            ok = bool(report) and not report['failed']
+            record(elapsed, ok, directory_size(output_dir), count=report['total'] if report else 0)
+
+    elif case in ("thumbnail_single", "thumbnail_batch"):
+        # the same fetch, decode, resize and border the search page does
+        from thumbnail_loader import ThumbnailLoader
+        loader = ThumbnailLoader()
+        batch = 1 if case == "thumbnail_single" else thumbnail_batch_size
+
+        def load_all(i):
+            items = [(n, f"{base_url}/thumbnails/{i}-{n}.jpg", None) for n in range(batch)]
+            loader.load(items, thumbnail_size, border=2, border_fill="#358D84")
+            done = []
+            while len(done) < batch:
+                done.extend(loader.poll())
+                time.sleep(0.001)
+            return all(img is not None for _, img, _ in done)
+
+        for i in range(iterations):
+            elapsed, ok = timed(lambda: load_all(i))
+            record(elapsed, ok, count=batch)
+        loader.shutdown()
+
+    else:
+        raise ValueError(f"Unknown case: {case}")
+
+    return {
+        'case': case,
+        'latencies': latencies,
+        'operations': operations,
+        'bytes': transferred,
+        'wall_seconds': time.perf_counter() - wall_start,
+        'errors': errors,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+
+# ---- the parent: start the server, run every case, report ----
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(result):
+    latencies = result['latencies']
+    if not latencies:
+        return {'errors': result['errors']}
+
+    busy = sum(latencies)
+    return {
+        'iterations': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 0.9) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+        'ops_per_second': round(result['operations'] / busy, 2) if busy else None,
+        'mb_per_second': round(result['bytes'] / busy / 1e6, 2) if busy and result['bytes'] else None,
+        'peak_rss_mb': round(result['peak_rss_bytes'] / 1e6, 1) if result['peak_rss_bytes'] else None,
+        'errors': result['errors'][:5],
+    }
+
+
+def run_child(case, base_url, args, work_dir):
+    case_dir = os.path.join(work_dir, case)
+    os.makedirs(case_dir, exist_ok=True)
+    command = [sys.executable, os.path.abspath(__file__), "--run-case", case, "--base-url", base_url,
+               "--iterations", str(args.iterations), "--work-dir", case_dir, "--audio-mode", args.audio_mode]
+    completed = subprocess.run(command, cwd=repo_dir, capture_output=True, text=True)
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        return {'errors': [completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "no output"]}
+    return summarize(json.loads(lines[-1]))
+
+
+def compare(report, baseline, tolerance):
+    # cases whose median got slower than the baseline allows
+    regressions = []
+    for case, result in report['cases'].items():
+        before = baseline.get('cases', {}).get(case, {}).get('p50_ms')
+        after = result.get('p50_ms')
+        if before and after and after > before * (1 + tolerance):
+            regressions.append({'case': case, 'baseline_p50_ms': before, 'p50_ms': after,
+                                'slower_by': f"{(after / before - 1) * 100:.0f}%"})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--cases", nargs="+", choices=all_cases, default=None, help="only run these cases")
+    parser.add_argument("--media-size", type=int, default=8 * 1024 * 1024,
+                        help="bytes of the fake video when ffmpeg is not installed")
+    parser.add_argument("--audio-mode", choices=("original", "mp3"), default="original")
+    parser.add_argument("--network", action="store_true", help="also run the cases that need youtube")
+    parser.add_argument("--save", help="write the report to this file")
+    parser.add_argument("--baseline", help="report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown of the median, 0.25 = 25%%")
+
+    # used by the parent to start one case
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        result = run_case(args.run_case, args.base_url, args.iterations, args.work_dir, args.audio_mode)
+        print(json.dumps(result))
+        return 0
+
+    cases = [case for case in (args.cases or all_cases) if args.network or case not in network_cases]
+
+    with tempfile.TemporaryDirectory(prefix="yt-benchmark-") as work_dir:
+        media, real_media = make_media(work_dir, args.media_size)
+        thumbnail = make_thumbnail()
+        if not real_media and "download_audio" in cases:
+            # the audio post processing needs ffmpeg and real media
+            cases.remove("download_audio")
+
+        server = start_server(media, thumbnail)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            results = {case: run_child(case, base_url, args, work_dir) for case in cases}
+        finally:
+            server.shutdown()
+
+    report = {
+        'iterations': args.iterations,
+        'real_media': real_media,
+        'cases': results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report['regressions'] = compare(report, json.load(f), args.tolerance)
+        exit_code = 1 if report['regressions'] else 0
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    print(json.dumps(report, indent=2))
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+'''
+measures how long the app takes to start
+
+every run is a fresh python process so nothing is already imported
+
+    python benchmarks/startup_benchmark.py --runs 10
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# heavy modules that should not be imported before the first frame
+heavy_modules = ("yt_dlp", "PIL", "requests")
+
+child_code = f'''
+import json, sys, time
+start = time.perf_counter()
+
+import yt_searcher
+searcher_imported = time.perf_counter()
+
+import gui
+gui_imported = time.perf_counter()
+
+result = {{
+    'import_yt_searcher': searcher_imported - start,
+    'import_gui': gui_imported - start,
+    'heavy_modules_loaded': [name for name in {heavy_modules!r} if name in sys.modules],
+    'first_frame': None,
+}}
+
+# the prewarm and resume work runs after the first frame, leave it out here
+gui.App.finish_startup = lambda self: None
+try:
+    app = gui.App()
+    app.update()
+    result['first_frame'] = time.perf_counter() - start
+    app.destroy()
+except Exception as e:
+    result['error'] = str(e)
+
+print(json.dumps(result))
+'''
+
+
+def run_once():
+    output = subprocess.run([sys.executable, "-c", child_code], cwd=repo_dir,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return {
+        'min_ms': round(min(values) * 1000, 1),
+        'median_ms': round(statistics.median(values) * 1000, 1),
+        'max_ms': round(max(values) * 1000, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    runs = [run_once() for _ in range(args.runs)]
+
+    report = {
+        'runs': args.runs,
+        'import_yt_searcher': summarize([run['import_yt_searcher'] for run in runs]),
+        'import_gui': summarize([run['import_gui'] for run in runs]),
+        'first_frame': summarize([run['first_frame'] for run in runs]),
+        'heavy_modules_loaded': sorted({name for run in runs for name in run['heavy_modules_loaded']}),
+        'errors': sorted({run['error'] for run in runs if run.get('error')}),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("yt_searcher.caches")
+
+
+class LRUCache():
+    '''
+    small thread safe LRU cache with an optional time to live (in seconds)
+
+    hits and misses are counted so the cache sizes can be tuned
+    '''
+    def __init__(self, max_items=128, ttl=None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+
+            if item is not None:
+                value, stored_at = item
+                if self.ttl is None or time.time() - stored_at < self.ttl:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return value
+
+                # expired, drop it
+                del self._items[key]
+
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = (value, time.time())
+            self._items.move_to_end(key)
+
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._items.pop(key, None)
+            return item[0] if item is not None else default
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._items),
+                'max_items': self.max_items,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+
+def normalize_query(query):
+    # "  Lo-Fi   Beats " and "lo-fi beats" are the same search
+    return " ".join(str(query).lower().split())
+
+
+class SearchCache():
+    '''
+    search results keyed on the normalized query and max_results
+
+    an in memory LRU sits in front of an optional on disk store (one JSON
+    file per search) so results also survive restarts until the ttl runs out
+    '''
+    def __init__(self, max_items=64, ttl=60 * 60, disk_dir=None, disk_ttl=6 * 60 * 60):
+        self.memory = LRUCache(max_items=max_items, ttl=ttl)
+        self.disk_dir = disk_dir
+        self.disk_ttl = disk_ttl
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def make_key(self, query, max_results):
+        return f"{normalize_query(query)}|{max_results}"
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.json")
+
+    def get(self, query, max_results):
+        key = self.make_key(query, max_results)
+
+        results = self.memory.get(key)
+        if results is not None:
+            with self._lock:
+                self.hits += 1
+            return results
+
+        if self.disk_dir:
+            results = self._read_disk(key)
+            if results is not None:
+                self.memory.put(key, results)
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return results
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, query, max_results, results):
+        key = self.make_key(query, max_results)
+        self.memory.put(key, results)
+
+        if self.disk_dir:
+            self._write_disk(key, results)
+
+    def _read_disk(self, key):
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if stored.get('key') != key or time.time() - stored.get('stored_at', 0) > self.disk_ttl:
+            return None
+        return stored.get('results')
+
+    def _write_disk(self, key, results):
+        path = self._disk_path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({'key': key, 'stored_at': time.time(), 'results': results}, f)
+            os.replace(temp_path, path)
+        except (OSError, TypeError) as e:
+            logger.warning(f"Error caching search: {e}")
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk_dir:
+            for name in os.listdir(self.disk_dir):
+                if name.endswith(".json"):
+                    try:
+                        os.remove(os.path.join(self.disk_dir, name))
+                    except OSError:
+                        pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory': self.memory.stats(),
+            }
@@ -0,0 +1,194 @@
+'''
+headless front end, no tkinter or PIL needed
+
+    python cli.py urls.txt -f mp3 -j 4
+
+every line of the input file is a video url, a playlist url or a search
+query (the top result is downloaded). progress is written to stdout as
+JSON lines and the last line is a summary, "progress" lines carry the
+bytes, total, speed and eta of every running download
+'''
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import redirect_stdout
+
+from download_scheduler import DownloadScheduler
+from progress import progress_bus
+from yt_searcher import download_audio, download_video, download_playlist, search_youtube, is_playlist
+from video_formats import format_for_height
+from rate_limits import bandwidth_governor, parse_rate
+
+default_output_path = os.path.join(os.path.dirname(__file__), "Downloads_ytdlp")
+
+# progress lines for one download are written at most this often (seconds) by default
+default_progress_interval = 1.0
+
+# -f choices that download audio, and the audio mode each one uses
+audio_modes = {'mp3': "mp3", 'audio': "original"}
+
+
+class JsonLinesReporter():
+    # writes one JSON object per line, safe to call from any thread
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        line = json.dumps({'event': event, 'time': round(time.time(), 3), **fields}, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def watch_progress(self, bus, interval=default_progress_interval):
+        '''
+        writes a progress line for downloading events on the bus, at most one
+        per download every interval seconds. returns the subscription
+        '''
+        last_emitted = {}
+        last_lock = threading.Lock()
+
+        def on_event(event):
+            if event.get('status') != "downloading":
+                return
+            job = event.get('job')
+            now = time.monotonic()
+            with last_lock:
+                if now - last_emitted.get(job, 0) < interval:
+                    return
+                last_emitted[job] = now
+
+            self.emit("progress", job=job, parent=event.get('parent'), title=event.get('title'),
+                      downloaded_bytes=event.get('downloaded_bytes'), total_bytes=event.get('total_bytes'),
+                      speed=event.get('speed'), eta=event.get('eta'))
+
+        return bus.subscribe(on_event)
+
+
+def read_inputs(paths):
+    items = []
+    for path in paths:
+        f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+        try:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    items.append(line)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+    return items
+
+
+def is_url(text):
+    return text.startswith(("http://", "https://", "www.", "youtu"))
+
+
+def run_item(item, args, reporter):
+    reporter.emit("started", input=item)
+    video_format = format_for_height(args.max_height)
+
+    if is_url(item) and is_playlist(item):
+        report = download_playlist(item, args.output, audio_only=(args.format != "mp4"),
+                                   audio_mode=audio_modes.get(args.format),
+                                   max_workers=args.playlist_workers,
+                                   concurrent_fragments=args.fragments, resumable=args.resume,
+                                   video_format=video_format)
+        if not report:
+            raise RuntimeError("Could not read playlist")
+        if report['failed']:
+            raise RuntimeError(f"{report['failed']} of {report['total']} playlist items failed")
+        return report
+
+    urls = [item]
+    if not is_url(item):
+        results = search_youtube(item, max_results=args.search_results) or []
+        urls = [result['url'] for result in results if result.get('url')]
+        if not urls:
+            raise RuntimeError("No search results")
+        reporter.emit("resolved", input=item, urls=urls)
+
+    def download(url):
+        if args.format != "mp4":
+            return download_audio(url, args.output, concurrent_fragments=args.fragments, resumable=args.resume,
+                                  audio_mode=audio_modes[args.format])
+        return download_video(url, args.output, concurrent_fragments=args.fragments, resumable=args.resume,
+                              video_format=video_format)
+
+    failed = [url for url in urls if not download(url)]
+    if failed:
+        raise RuntimeError(f"Failed to download {', '.join(failed)}")
+    return {'downloaded': urls}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Download YouTube videos without the GUI")
+    parser.add_argument("inputs", nargs="+", help="files with one url or search query per line, - for stdin")
+    parser.add_argument("-o", "--output", default=default_output_path, help="download directory")
+    parser.add_argument("-f", "--format", choices=("mp3", "audio", "mp4"), default="mp3",
+                        help="audio keeps the original m4a/opus stream instead of re-encoding to mp3")
+    parser.add_argument("-j", "--jobs", type=int, default=3, help="inputs processed at the same time")
+    parser.add_argument("--playlist-workers", type=int, default=None, help="items per playlist downloaded at once")
+    parser.add_argument("--search-results", type=int, default=1, help="results downloaded per search query")
+    parser.add_argument("--max-height", type=int, default=None,
+                        help="highest video resolution for mp4, lower saves bandwidth (default 720)")
+    parser.add_argument("--fragments", type=int, default=None, help="parallel fragments per download")
+    parser.add_argument("--limit-rate", type=parse_rate, default=0,
+                        help="total download speed for everything, like 500K or 2M per second (default no limit)")
+    parser.add_argument("--job-limit-rate", type=parse_rate, default=0,
+                        help="download speed for each input on its own, a playlist counts as one")
+    parser.add_argument("--progress-interval", type=float, default=default_progress_interval,
+                        help="seconds between progress lines of one download, 0 turns them off")
+    parser.add_argument("--no-resume", dest="resume", action="store_false", default=None,
+                        help="start interrupted downloads over instead of continuing their .part files")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # log records go to stderr like everything else that is not a JSON line
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(levelname)s %(name)s: %(message)s")
+    reporter = JsonLinesReporter(sys.stdout)
+    if args.progress_interval > 0:
+        reporter.watch_progress(progress_bus, args.progress_interval)
+
+    items = read_inputs(args.inputs)
+    bandwidth_governor.set_limits(args.limit_rate, args.job_limit_rate)
+    scheduler = DownloadScheduler(max_workers=max(1, args.jobs))
+    outcomes = []
+
+    def on_done(job, item):
+        duration = round(job.finished_at - job.started_at, 3)
+        if job.status == "done":
+            reporter.emit("finished", input=item, seconds=duration, result=job.result)
+        else:
+            reporter.emit("failed", input=item, seconds=duration, error=str(job.error))
+        outcomes.append(job.status == "done")
+
+    # anything else printed while downloading goes to stderr so stdout stays valid JSON
+    with redirect_stdout(sys.stderr):
+        started_at = time.time()
+        for item in items:
+            reporter.emit("queued", input=item)
+            scheduler.submit(run_item, item, args, reporter, name=item,
+                             callback=lambda job, item=item: on_done(job, item))
+
+        while len(outcomes) < len(items):
+            scheduler.poll()
+            time.sleep(0.1)
+
+        scheduler.shutdown()
+
+    succeeded = sum(1 for ok in outcomes if ok)
+    reporter.emit("summary", total=len(items), succeeded=succeeded, failed=len(items) - succeeded,
+                  seconds=round(time.time() - started_at, 3))
+
+    return 0 if succeeded == len(items) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
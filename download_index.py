@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+index_filename = ".download_index.sqlite3"
+
+
+def file_checksum(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadIndex():
+    '''
+    sqlite record of everything downloaded into one output directory
+
+    one row per (video id, format) with the output path, size, checksum and
+    time, so a video is only fetched again when its file is gone or changed
+
+    downloads that have started but not finished are kept in a second table
+    so they can be picked up again after a crash or restart, with the
+    transfer options (video format, rate limit, ...) they were started with
+    as JSON, so they continue the same .part files
+    '''
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, index_filename)
+        self._lock = threading.Lock()
+
+        os.makedirs(output_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS downloads (
+                    video_id TEXT NOT NULL,
+                    format TEXT NOT NULL,
+                    output_path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    checksum TEXT NOT NULL,
+                    downloaded_at REAL NOT NULL,
+                    PRIMARY KEY (video_id, format)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pending (
+                    url TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    started_at REAL NOT NULL,
+                    options TEXT,
+                    PRIMARY KEY (url, kind)
+                )
+            """)
+            # indexes made before pending downloads kept their options
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(pending)")]
+            if 'options' not in columns:
+                conn.execute("ALTER TABLE pending ADD COLUMN options TEXT")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def lookup(self, video_id, fmt):
+        # the record for a finished download, as long as its file is still there
+        if not video_id:
+            return None
+
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT output_path, size, checksum, downloaded_at FROM downloads "
+                "WHERE video_id = ? AND format = ?", (video_id, fmt)).fetchone()
+
+        if row is None:
+            return None
+
+        output_path, size, checksum, downloaded_at = row
+        try:
+            if os.path.getsize(output_path) != size:
+                return None
+        except OSError:
+            return None
+
+        return {
+            'video_id': video_id,
+            'format': fmt,
+            'output_path': output_path,
+            'size': size,
+            'checksum': checksum,
+            'downloaded_at': downloaded_at,
+        }
+
+    def record(self, video_id, fmt, output_path):
+        if not video_id or not output_path or not os.path.exists(output_path):
+            return None
+
+        size = os.path.getsize(output_path)
+        checksum = file_checksum(output_path)
+        downloaded_at = time.time()
+
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO downloads "
+                "(video_id, format, output_path, size, checksum, downloaded_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (video_id, fmt, output_path, size, checksum, downloaded_at))
+
+        return checksum
+
+    def forget(self, video_id, fmt=None):
+        with self._lock, self._connect() as conn:
+            if fmt is None:
+                conn.execute("DELETE FROM downloads WHERE video_id = ?", (video_id,))
+            else:
+                conn.execute("DELETE FROM downloads WHERE video_id = ? AND format = ?", (video_id, fmt))
+
+    def mark_pending(self, url, kind, options=None):
+        options = {key: value for key, value in (options or {}).items() if value is not None}
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO pending (url, kind, started_at, options) VALUES (?, ?, ?, ?)",
+                         (url, kind, time.time(), json.dumps(options)))
+
+    def clear_pending(self, url, kind):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM pending WHERE url = ? AND kind = ?", (url, kind))
+
+    def pending(self):
+        with self._lock, self._connect() as conn:
+            rows = conn.execute("SELECT url, kind, started_at, options FROM pending ORDER BY started_at").fetchall()
+
+        return [{'url': url, 'kind': kind, 'started_at': started_at, 'options': json.loads(options or "{}")}
+                for url, kind, started_at, options in rows]
+
+    def entries(self):
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT video_id, format, output_path, size, checksum, downloaded_at FROM downloads "
+                "ORDER BY downloaded_at").fetchall()
+
+        keys = ('video_id', 'format', 'output_path', 'size', 'checksum', 'downloaded_at')
+        return [dict(zip(keys, row)) for row in rows]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_download_index(output_dir):
+    # one index per output directory
+    key = os.path.abspath(output_dir)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = DownloadIndex(key)
+        return _indexes[key]
@@ -0,0 +1,109 @@
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# how many downloads can run at the same time by default
+default_max_workers = 3
+
+
+class DownloadJob():
+    def __init__(self, job_id, name, callback=None):
+        self.id = job_id
+        self.name = name
+        self.callback = callback
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.future = None
+        self.started_at = None
+        self.finished_at = None
+
+    def done(self):
+        return self.status in ("done", "failed", "cancelled")
+
+
+class DownloadScheduler():
+    '''
+    runs downloads on a bounded pool of worker threads
+
+    finished jobs are put on the completed queue, the GUI drains it with
+    poll() from an after() loop so callbacks always run on the Tk thread
+    '''
+    def __init__(self, max_workers=default_max_workers):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="download")
+        self.completed = queue.Queue()
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, name=None, callback=None, **kwargs):
+        with self._lock:
+            job = DownloadJob(next(self._ids), name or func.__name__, callback)
+            self.jobs[job.id] = job
+
+        job.future = self.executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = func(*args, **kwargs)
+            job.status = "done"
+        except Exception as e:
+            job.error = e
+            job.status = "failed"
+
+        job.finished_at = time.time()
+        self.completed.put(job)
+        return job.result
+
+    def cancel(self, job):
+        # only a job that has not started yet can be cancelled, returns whether it was
+        if job.future is None or not job.future.cancel():
+            return False
+
+        job.status = "cancelled"
+        with self._lock:
+            self.jobs.pop(job.id, None)
+        return True
+
+    def poll(self):
+        # drain every finished job, should be called from the thread that owns the callbacks
+        finished = []
+        while True:
+            try:
+                job = self.completed.get_nowait()
+            except queue.Empty:
+                break
+
+            with self._lock:
+                self.jobs.pop(job.id, None)
+
+            if job.callback:
+                job.callback(job)
+            finished.append(job)
+
+        return finished
+
+    def active_jobs(self):
+        with self._lock:
+            return [job for job in self.jobs.values() if not job.done()]
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    # one shared scheduler for the whole process
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = DownloadScheduler()
+        return _scheduler
@@ -1,19 +1,54 @@
 import tkinter as tk
-from PIL import Image, ImageTk, ImageOps
-from yt_searcher import yt_search
-import requests
-from io import BytesIO
+from tkinter import ttk
+from lazy_imports import lazy_module, prewarm
+from yt_searcher import yt_search, iter_search_pages, next_search_page, download_settings, resume_pending_downloads
+from yt_searcher import prefetch_video, prefetch_count
+from yt_searcher import yt_dlp
+from download_scheduler import get_scheduler, DownloadScheduler
+from thumbnail_loader import ThumbnailLoader
+from thumbnail_cache import get_thumbnail_cache, preview_size
+from progress import progress_bus, describe_progress
+from queue_manager import get_queue_manager, max_queue_concurrent, queue_actions
 import os
 
 font_size_normal = 20
 font_size_Normal = 24
 font_size_large = 48
 
+# how often (ms) the GUI checks for finished background downloads
+poll_interval = 100
+
+# search results are loaded this many at a time
+page_size = 10
+
+# live search waits this long (ms) after the last key press, and for at least this many characters
+search_debounce = 400
+live_search_min_length = 3
+
+# height of one search result tile, and how many tiles above and below the
+# visible ones keep their canvas items and images
+tile_height = 400
+tile_margin = 2
+
+# how often (ms) progress views redraw, events in between are skipped
+progress_refresh_interval = 250
+
+# how often (ms) the download queue starts waiting jobs and the queue page redraws
+queue_pump_interval = 1000
+
+# first entry of the downloads page quality list, the best mp4 up to max_height
+default_quality_label = "Best available (default)"
+
 button_width = 25
 
 triton_green = "#046A38"
 accent_green = "#358D84"
 
+default_output_path = os.path.join(os.path.dirname(__file__), "Downloads_ytdlp")
+
+# PIL is only needed once thumbnails are shown
+ImageTk = lazy_module("PIL.ImageTk")
+
 # we will create a main class for the GUI of this app
 class App(tk.Tk):
 
@@ -29,31 +64,186 @@ class App(tk.Tk):
         container.grid_rowconfigure(0, weight=1)
         container.grid_columnconfigure(0, weight=1)
         
-        # Dictionary to hold all frames/pages
+        # Dictionary to hold all frames/pages, pages are only built the first time they are shown
+        self.container = container
         self.frames = {}
-        
-        # Create all pages
-        for PageClass in (HomePage, AboutPage, SearchPage, DownloadsPage, LinkPage, PlaylistPage):
-            page_name = PageClass.__name__
-            frame = PageClass(parent=container, controller=self)
-            frame.configure(bg = triton_green)
-            self.frames[page_name] = frame
-            frame.grid(row=0, column=0, sticky="nsew")
+        self.page_classes = {PageClass.__name__: PageClass for PageClass in
+                             (HomePage, AboutPage, SearchPage, DownloadsPage, LinkPage, PlaylistPage, QueuePage)}
+        self.current_page = None
         
         # Show login page first
         self.show_frame("HomePage")
 
+        # downloads run on the scheduler, check on them from the Tk thread
+        self.scheduler = get_scheduler()
+        self.after(poll_interval, self.poll_downloads)
+
+        # the download queue is kept on disk and runs on its own scheduler
+        self.queue = get_queue_manager(default_output_path)
+        self.after(queue_pump_interval, self.pump_queue)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # once the first frame is up, load the heavy modules and resume old downloads
+        self.after_idle(self.finish_startup)
+
+    def finish_startup(self):
+        prewarm(yt_dlp, ImageTk)
+
+        # pick up anything that was still downloading when the app last closed
+        resume_pending_downloads(default_output_path, scheduler=self.scheduler)
+
+    def get_frame(self, page_name):
+        if page_name not in self.frames:
+            frame = self.page_classes[page_name](parent=self.container, controller=self)
+            frame.configure(bg = triton_green)
+            frame.grid(row=0, column=0, sticky="nsew")
+            self.frames[page_name] = frame
+        return self.frames[page_name]
+
+    def poll_downloads(self):
+        self.scheduler.poll()
+        self.queue.scheduler.poll()
+        self.after(poll_interval, self.poll_downloads)
+
+    def pump_queue(self):
+        self.queue.pump()
+        self.after(queue_pump_interval, self.pump_queue)
+
+    def enqueue(self, url, kind, title=None, options=None):
+        # add a download to the queue, the queue page shows how it is doing
+        return self.queue.enqueue(url, kind, default_output_path, title=title, options=options)
+
+    def on_close(self):
+        # queued downloads stop here and carry on the next time the app starts
+        self.queue.shutdown()
+        self.destroy()
+
     def show_frame(self, page_name, data=None):
-        frame = self.frames[page_name]
+        frame = self.get_frame(page_name)
         frame.tkraise()
+
+        # pages with timers only run them while they are on screen
+        previous = self.frames.get(self.current_page)
+        if previous is not None and previous is not frame and hasattr(previous, 'on_hide'):
+            previous.on_hide()
+        self.current_page = page_name
+        if hasattr(frame, 'on_show'):
+            frame.on_show()
         
         if data is not None and hasattr(frame, 'load_data'):
             frame.load_data(data)
 
+        if hasattr(frame, 'settings_frame'):
+            frame.settings_frame.refresh()
+
         # Update window title
         self.title(f"Youtube Search App by MarkIraCarey - {page_name.replace('Page', '')}")
 
 
+def audio_kind(setting='audio_mode'):
+    # "audio" keeps the original format, "mp3" re-encodes, whichever the settings ask for
+    return "audio" if download_settings[setting] == "original" else "mp3"
+
+
+def audio_label(setting='audio_mode'):
+    # what the audio buttons call the format they download
+    return "Audio" if audio_kind(setting) == "audio" else "MP3"
+
+
+class DownloadSettingsFrame(tk.Frame):
+    # fragment count, resume and audio format switches, shared by all of the download pages
+    def __init__(self, parent, bg=triton_green, audio_setting='audio_mode', on_change=None):
+        super().__init__(parent, bg=bg)
+        self.audio_setting = audio_setting
+        # called after the settings changed, from here or from another page
+        self.on_change = on_change
+
+        self.fragments = tk.IntVar(value=download_settings['concurrent_fragments'])
+        self.resumable = tk.BooleanVar(value=download_settings['resumable'])
+        self.original_audio = tk.BooleanVar(value=download_settings[audio_setting] == "original")
+
+        tk.Label(self, text="Parallel fragments:", bg=bg).pack(side="left")
+        tk.Spinbox(self, from_=1, to=16, width=3, textvariable=self.fragments,
+                   command=self.apply).pack(side="left", padx=5)
+        tk.Checkbutton(self, text="Resume downloads", variable=self.resumable, bg=bg,
+                       command=self.apply).pack(side="left", padx=5)
+        tk.Checkbutton(self, text="Original audio (no mp3)", variable=self.original_audio, bg=bg,
+                       command=self.apply).pack(side="left", padx=5)
+
+    def apply(self):
+        try:
+            download_settings['concurrent_fragments'] = max(1, int(self.fragments.get()))
+        except (tk.TclError, ValueError):
+            pass
+        download_settings['resumable'] = bool(self.resumable.get())
+        download_settings[self.audio_setting] = "original" if self.original_audio.get() else "mp3"
+        if self.on_change:
+            self.on_change()
+
+    def refresh(self):
+        # another page may have changed the settings
+        self.fragments.set(download_settings['concurrent_fragments'])
+        self.resumable.set(download_settings['resumable'])
+        self.original_audio.set(download_settings[self.audio_setting] == "original")
+        if self.on_change:
+            self.on_change()
+
+
+class ProgressView(tk.Frame):
+    '''
+    progress bar and text for one download (or playlist) job
+
+    it reads the latest event from the progress bus on its own after() timer,
+    so a fast stream of yt-dlp events never floods the Tk event loop
+    '''
+    def __init__(self, parent, bg=triton_green, show_items=0, wraplength=360):
+        super().__init__(parent, bg=bg)
+        self.job_key = None
+        self.show_items = show_items
+        self.refreshing = False
+
+        self.bar = ttk.Progressbar(self, orient="horizontal", length=300, mode="determinate", maximum=100)
+        self.bar.pack(pady=2)
+        self.label = tk.Label(self, text="", font=("Arial", 12), bg=bg, wraplength=wraplength, justify="left")
+        self.label.pack()
+
+    def track(self, job_key):
+        self.job_key = job_key
+        progress_bus.forget(job_key)
+        self.bar.config(value=0)
+        self.label.config(text="Waiting to start...")
+
+        if not self.refreshing:
+            self.refreshing = True
+            self.refresh()
+
+    def refresh(self):
+        event = progress_bus.latest(self.job_key)
+        lines = [describe_progress(event)] if event else ["Waiting to start..."]
+
+        if event and event.get('status') == "downloading" and event.get('total_bytes'):
+            self.bar.config(value=100 * event['downloaded_bytes'] / event['total_bytes'])
+        elif event and event.get('status') == "playlist_progress" and event.get('total'):
+            self.bar.config(value=100 * event['completed'] / event['total'])
+
+        # playlists also list what their items are doing right now
+        if self.show_items:
+            children = [child for child in progress_bus.latest_children(self.job_key)
+                        if child.get('status') not in ("finished", "error")]
+            for child in children[:self.show_items]:
+                lines.append(f"{(child.get('title') or '')[0:25]}: {describe_progress(child)}")
+
+        self.label.config(text="\n".join(lines))
+
+        if event and event.get('status') in ("finished", "error", "cancelled"):
+            if event.get('status') == "finished":
+                self.bar.config(value=100)
+            self.refreshing = False
+            return
+
+        self.after(progress_refresh_interval, self.refresh)
+
+
 class HomePage(tk.Frame):
 
     def __init__(self, parent, controller):
@@ -102,6 +292,12 @@ class HomePage(tk.Frame):
                              command=lambda: controller.show_frame("PlaylistPage"))
         plink_only_btn.pack()
 
+        # add a download queue button
+        queue_btn = tk.Button(content_frame, text="Download Queue",
+                             font=("Arial", font_size_normal),
+                             command=lambda: controller.show_frame("QueuePage"))
+        queue_btn.pack()
+
 
 class AboutPage(tk.Frame):
     def __init__(self, parent, controller):
@@ -156,27 +352,138 @@ class SearchPage(tk.Frame):
         entry = tk.Entry(self, width = 30, font=("Arial", font_size_Normal))
         entry.pack(padx = 5, pady = 5)
         
+        # pages of results are fetched one at a time in the background, a
+        # second worker lets a new search start while a replaced one is still running
+        self.search_jobs = DownloadScheduler(max_workers=2)
+        self.search_pages = None
+        self.search_generation = 0
+        self.loading_page = False
+        self.page_job = None
+        self.searched_text = None
+        self.polling_search = False
+
+        # metadata and formats of the top results, fetched while the user looks at them
+        self.prefetch_jobs = DownloadScheduler(max_workers=2)
+        self.prefetches = []
+        self.polling_prefetch = False
+
+        # live search runs once typing stops for search_debounce ms
+        self.live_search = tk.BooleanVar(value=True)
+        self.debounce_id = None
+
         # Button to get the text
-        def search_video():
-            text = entry.get()
-            
-            # create an instance of the yt_searcher
-            searcher = yt_search(query = text)
+        def search_video(live=False):
+            text = entry.get().strip()
+            if not text or (live and (len(text) < live_search_min_length or text == self.searched_text)):
+                return
+
+            # whatever the old search still had waiting will not be needed
+            if self.page_job is not None:
+                self.search_jobs.cancel(self.page_job)
+                self.page_job = None
+            cancel_prefetches()
+
+            # start over with a fresh set of pages
+            update_search([])
+            self.search_generation += 1
+            self.searched_text = text
+            self.search_pages = iter_search_pages(text, page_size=page_size)
+            self.loading_page = False
+            load_next_page()
+
+        def on_key(event):
+            if event.keysym == "Return":
+                return
+            if self.debounce_id is not None:
+                self.after_cancel(self.debounce_id)
+                self.debounce_id = None
+            if self.live_search.get():
+                self.debounce_id = self.after(search_debounce, on_typing_stopped)
+
+        def on_typing_stopped():
+            self.debounce_id = None
+            search_video(live=True)
+
+        def on_return(event):
+            if self.debounce_id is not None:
+                self.after_cancel(self.debounce_id)
+                self.debounce_id = None
+            search_video()
+
+        entry.bind("<KeyRelease>", on_key)
+        entry.bind("<Return>", on_return)
+
+        def load_next_page():
+            if self.loading_page or self.search_pages is None:
+                return
+
+            self.loading_page = True
+            generation = self.search_generation
+            self.page_job = self.search_jobs.submit(next_search_page, self.search_pages, name="search page",
+                                                    callback=lambda job: on_page_loaded(job, generation))
+            if not self.polling_search:
+                self.polling_search = True
+                poll_search_jobs()
+
+        def poll_search_jobs():
+            # keeps going while a replaced search is still running so its job gets drained
+            self.search_jobs.poll()
+            if self.loading_page or self.search_jobs.active_jobs():
+                self.after(poll_interval, poll_search_jobs)
+            else:
+                self.polling_search = False
+
+        def on_page_loaded(job, generation):
+            # ignore pages from a search that has been replaced
+            if generation != self.search_generation:
+                return
+
+            self.loading_page = False
+            self.page_job = None
+            if job.status != "done" or not job.result:
+                # nothing more to load
+                self.search_pages = None
+                return
+
+            first_page = not self.video_urls
+            append_results(job.result)
+            if first_page:
+                prefetch_results(self.video_urls[:prefetch_count])
+
+        def prefetch_results(urls):
+            for url in urls:
+                self.prefetches.append(self.prefetch_jobs.submit(prefetch_video, url, name=f"prefetch {url}"))
+            if not self.polling_prefetch:
+                self.polling_prefetch = True
+                poll_prefetch_jobs()
+
+        def poll_prefetch_jobs():
+            self.prefetch_jobs.poll()
+            if self.prefetch_jobs.active_jobs():
+                self.after(poll_interval, poll_prefetch_jobs)
+            else:
+                self.polling_prefetch = False
+                self.prefetches.clear()
+
+        def cancel_prefetches():
+            # the ones already running finish, their results still land in the cache
+            for job in self.prefetches:
+                self.prefetch_jobs.cancel(job)
+            self.prefetches.clear()
 
-            # then append the results
-            update_search(searcher.get_results())
-            
         # Search button
         submit_button = tk.Button(self, text="Submit Search", font=("Arial", font_size_normal), command=search_video)
         submit_button.pack(pady=10)
+        tk.Checkbutton(self, text="Search as you type", variable=self.live_search,
+                       font=("Arial", font_size_normal)).pack()
 
         # create the downloads function
-        def on_image_click(video_url, photo_url, title, photo):
+        def on_image_click(video_url, photo_url, title, cache_key=None):
             download_data = {
                 'photo_url': photo_url,
                 'title': title,
-                'photo': photo,
-                'video_url': video_url
+                'video_url': video_url,
+                'cache_key': cache_key or photo_url
             }
             # open up the new page
             controller.show_frame("DownloadsPage", download_data)
@@ -194,104 +501,214 @@ class SearchPage(tk.Frame):
         search_results = tk.Canvas(canvas_frame, bg="#929292", width=canvasx, height=canvasy)
         scrollbar = tk.Scrollbar(canvas_frame, orient="vertical", command=search_results.yview)
 
+        # load the next page once the user scrolls close to the bottom, and
+        # move the tiles along with the view
+        def on_scroll(first, last):
+            scrollbar.set(first, last)
+            schedule_window_update()
+            if float(last) >= 0.9:
+                load_next_page()
+
         # Configure canvas
-        search_results.configure(yscrollcommand=scrollbar.set)
+        search_results.configure(yscrollcommand=on_scroll)
         search_results.config(scrollregion=(0, 0, 500, 500))
 
         # Pack them side by side
         search_results.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
 
-        # Store thumbnail objects for reference
+        # what we know about every result, this stays small even for long lists
         self.thumbnail_items = []
         self.video_urls = []
+        self.video_ids = []
         self.titles = []
         self.channel_names = []
-        self.image_references = []
-
-        # firt create a method to create a small tkinter object for the canvas
-        def create_thumbnail(canvas):
-            thumbnail_urls = self.thumbnail_items
-            titles = self.titles
-            channels = self.channel_names
-            videos = self.video_urls
-
-            # track vertical position
-            y_position = 10
-            # get the images
-            for url, title, channel, video in zip(thumbnail_urls, titles, channels, videos):
-                # create the image
-                try:
-                    # download image
-                    response = requests.get(url, timeout=5)
-
-                    # get the metadata
-                    img_data = BytesIO(response.content)  
-
-                    # load in image, fit it to the canvas with a little padding
-                    img = Image.open(img_data)
-
-                    # keep all images the same size
-                    img = img.resize((int(canvasx * 0.95), 315))
-
-                    # add a border to the photo
-                    img = ImageOps.expand(img, border=2, fill=accent_green)
-
-                    # convert to PhotoImage for tkinter
-                    photo = ImageTk.PhotoImage(img)
-                    
-                    # add it to the canvas
-                    image_id = canvas.create_image(18, y_position, anchor="nw", image=photo)
-
-                    # add text below it
-                    texts = " | " + channel + " | "
-                    if len(title) > 40:
-                        texts += title[0:40] + "..."
-                    else:
-                        texts += title
 
-                    text_id = canvas.create_text(18, y_position + 321, anchor="nw", text=texts, 
-                                                 font=("Arial", font_size_normal, "bold"), fill="white")
-
-                    # keep reference so it doesn't get garbage collected
-                    self.image_references.append(photo)
-
-                    # make both the text and the image clickable
-                    canvas.tag_bind(image_id, "<Button-1>", lambda event, v=video, u=url, t=title, p=img: on_image_click(v, u, t, p)) 
-                    canvas.tag_bind(text_id, "<Button-1>", lambda event, v=video, u=url, t=title, p=img: on_image_click(v, u, t, p))
-
-                    # move to next image
-                    y_position += 400
-
-                except Exception as e:
-                    # create a colored rectangle as fallback
-                    canvas.create_rectangle(18, y_position, int(canvasx * 0.95), 315, fill="gray")
-                    canvas.create_text(105, y_position + (y_position//2), text="Image\nFailed", fill="white")
-
-                    y_position += 400
-
-            canvas.config(scrollregion=(0, 0, canvasx, y_position + 10))
+        # only the tiles near the visible part of the canvas exist, a slot is
+        # one tile's canvas items and gets moved to a new result when its old one scrolls away
+        self.slots = []
+        self.slot_of = {}
+
+        # PhotoImages of the tiles that have a slot, dropped when the slot is released
+        self.photos = {}
+        self.requested = set()
+        self.failed = set()
+        self.window_pending = False
+
+        # thumbnails are fetched and resized in the background, then painted as they arrive
+        self.thumbnail_loader = ThumbnailLoader(cache=get_thumbnail_cache())
+        self.painting = False
+
+        thumbnail_size = (int(canvasx * 0.95), 315)
+
+        def tile_y(index):
+            # every result gets the same slot height
+            return 10 + index * tile_height
+
+        def tile_text(title, channel):
+            texts = " | " + (channel or "") + " | "
+            title = title or ""
+            if len(title) > 40:
+                texts += title[0:40] + "..."
+            else:
+                texts += title
+            return texts
+
+        def on_tile_click(slot):
+            index = slot['index']
+            if index is None:
+                return
+
+            # the downloads page gets its preview from the thumbnail cache, no image is passed along
+            url = self.thumbnail_items[index]
+            on_image_click(self.video_urls[index], url, self.titles[index], self.video_ids[index] or url)
+
+        def new_slot(canvas):
+            # the items are created once and only moved around after that
+            tag = f"slot{len(self.slots)}"
+            slot = {
+                'index': None,
+                'tag': tag,
+                'rect': canvas.create_rectangle(0, 0, 0, 0, fill="gray", outline=accent_green, tags=(tag,)),
+                'label': canvas.create_text(0, 0, text="Loading...", fill="white", tags=(tag,)),
+                'image': canvas.create_image(0, 0, anchor="nw", tags=(tag,)),
+                'text': canvas.create_text(0, 0, anchor="nw", font=("Arial", font_size_normal, "bold"),
+                                           fill="white", tags=(tag,)),
+            }
+            canvas.tag_bind(tag, "<Button-1>", lambda event, slot=slot: on_tile_click(slot))
+            self.slots.append(slot)
+            return slot
+
+        def show_tile(canvas, slot):
+            # image if we have one, otherwise the gray box
+            index = slot['index']
+            photo = self.photos.get(index)
+            shown = photo is not None
+            canvas.itemconfig(slot['image'], image=photo if shown else "", state="normal" if shown else "hidden")
+            canvas.itemconfig(slot['rect'], state="hidden" if shown else "normal")
+            canvas.itemconfig(slot['label'], state="hidden" if shown else "normal",
+                              text="Image\nFailed" if index in self.failed else "Loading...")
+
+        def place_slot(canvas, slot, index):
+            y_position = tile_y(index)
+            slot['index'] = index
+            self.slot_of[index] = slot
+
+            canvas.coords(slot['rect'], 18, y_position, 18 + thumbnail_size[0] + 4, y_position + thumbnail_size[1] + 4)
+            canvas.coords(slot['label'], 18 + thumbnail_size[0] // 2, y_position + thumbnail_size[1] // 2)
+            canvas.coords(slot['image'], 18, y_position)
+            canvas.coords(slot['text'], 18, y_position + 321)
+            canvas.itemconfig(slot['text'], state="normal",
+                              text=tile_text(self.titles[index], self.channel_names[index]))
+            show_tile(canvas, slot)
+
+        def release_slot(canvas, slot):
+            self.slot_of.pop(slot['index'], None)
+            self.photos.pop(slot['index'], None)
+            slot['index'] = None
+            canvas.itemconfig(slot['tag'], state="hidden")
+            canvas.itemconfig(slot['image'], image="")
+
+        def schedule_window_update():
+            if not self.window_pending:
+                self.window_pending = True
+                self.after_idle(lambda: update_window(search_results))
+
+        def update_window(canvas):
+            # give a slot to every result in view (plus a margin) and take it away from the rest
+            self.window_pending = False
+            count = len(self.titles)
+            top = canvas.canvasy(0)
+            height = canvas.winfo_height() if canvas.winfo_height() > 1 else canvasy
+            first = max(0, int((top - 10) // tile_height) - tile_margin)
+            last = min(count, int((top + height - 10) // tile_height) + 1 + tile_margin)
+            wanted = range(first, last)
+
+            for slot in self.slots:
+                if slot['index'] is not None and slot['index'] not in wanted:
+                    release_slot(canvas, slot)
+
+            free = [slot for slot in self.slots if slot['index'] is None]
+            missing = []
+            for index in wanted:
+                if index in self.slot_of:
+                    continue
+                place_slot(canvas, free.pop() if free else new_slot(canvas), index)
+                if index not in self.failed and index not in self.requested:
+                    missing.append(index)
+
+            request_thumbnails(canvas, missing)
+
+        def request_thumbnails(canvas, indices):
+            if not indices:
+                return
+
+            # tiles that scrolled past before a worker got to them are skipped
+            self.requested.update(indices)
+            items = [(index, self.thumbnail_items[index], self.video_ids[index] or self.thumbnail_items[index])
+                     for index in indices]
+            self.thumbnail_loader.load(items, thumbnail_size, border=2, border_fill=accent_green,
+                                       reset=False, wanted=lambda index: index in self.slot_of)
+
+            if not self.painting:
+                self.painting = True
+                paint_thumbnails(canvas)
+
+        def paint_thumbnails(canvas):
+            for index, img, error in self.thumbnail_loader.poll():
+                self.requested.discard(index)
+                if error is not None:
+                    self.failed.add(index)
+
+                slot = self.slot_of.get(index)
+                if slot is None:
+                    # scrolled out of view, a fresh request is made if it comes back
+                    continue
+
+                if img is not None:
+                    # convert to PhotoImage for tkinter, this has to happen on the Tk thread
+                    self.photos[index] = ImageTk.PhotoImage(img)
+                elif error is None:
+                    # skipped while it was out of view, but it is back now
+                    request_thumbnails(canvas, [index])
+                show_tile(canvas, slot)
+
+            if self.requested:
+                self.after(50, lambda: paint_thumbnails(canvas))
+            else:
+                self.painting = False
 
         def update_search(search_results_list):
             # reset
-            search_results.delete("all")  
+            self.thumbnail_loader.cancel()
+            for slot in self.slots:
+                release_slot(search_results, slot)
             self.thumbnail_items.clear()
             self.titles.clear()
             self.channel_names.clear()
-            self.image_references.clear()
             self.video_urls.clear()
+            self.video_ids.clear()
+            self.photos.clear()
+            self.requested.clear()
+            self.failed.clear()
+            search_results.yview_moveto(0)
+
+            append_results(search_results_list)
+
+        def append_results(search_results_list):
             ''' 
             get the thumbnails and title for each result
             the title will be the name of the picture, then the thumbnail is the picture
             '''
-            
-            for result in search_results_list:
+            for result in search_results_list or []:
                 self.thumbnail_items.append(result['thumbnail'])
                 self.titles.append(result['title'])
                 self.channel_names.append(result['channel'])
                 self.video_urls.append(result['url'])
+                self.video_ids.append(result.get('id'))
 
-            create_thumbnail(search_results)
+            search_results.config(scrollregion=(0, 0, canvasx, tile_y(len(self.titles)) + 10))
+            schedule_window_update()
 
         # the back button
         back_btn = tk.Button(self, text="← Back to Home",
@@ -312,7 +729,7 @@ class DownloadsPage(tk.Frame):
         # make a center frame 
         self.center_frame = tk.Frame(self, bg="gray", relief="raised", bd=3)
         self.center_frame.place(relx=0.5, rely=0.5, anchor="center", 
-                               width=400, height=500)
+                               width=400, height=620)
         
         # Initialize empty data
         self.photo_url_link = None
@@ -321,28 +738,50 @@ class DownloadsPage(tk.Frame):
         self.photo_video = None
         self.output_path = os.path.join(os.path.dirname(__file__), "Downloads_ytdlp")
 
+        # the formats of the video on show are probed in the background
+        self.probe_jobs = DownloadScheduler(max_workers=1)
+        self.format_choices = []
+        self.pending_probes = 0
+
         # Create widgets but don't populate yet
         self.create_widgets()
 
     def create_widgets(self):
 
-        def download_audio():
+        def on_download_done(job, title):
+            if job.status == "done" and job.result:
+                self.status_label.config(text=f"Finished: {title[0:30]}", fg="green")
+            else:
+                self.status_label.config(text=f"Failed: {title[0:30]}", fg="red")
+            print("Ended Downloading")
+
+        def start_download(action):
+            if not self.video_url_link:
+                return
+
             # create a yt_searcher 
-            searcher = yt_search(url = self.video_url_link , title = self.title_video, path = self.output_path)
+            searcher = yt_search(url = self.video_url_link , title = self.title_video, path = self.output_path,
+                                 video_format = self.selected_format())
 
-            # then download!
+            # then download in the background!
             print("Started Downloading")
-            searcher.download_mp3()
-            print("Ended Downloading")
+            title = self.title_video
+            self.progress_view.track(searcher.job_key)
+            searcher.submit(action, callback=lambda job: on_download_done(job, title))
+            self.status_label.config(text=f"Downloading: {title[0:30]}", fg="white")
+
+        def download_audio():
+            start_download(queue_actions[audio_kind()])
 
         def download_video():
-            # create a yt_searcher 
-            searcher = yt_search(url = self.video_url_link , title = self.title_video, path = self.output_path)
+            start_download("download_mp4")
 
-            # then download!
-            print("Started Downloading")
-            searcher.download_mp4()
-            print("Ended Downloading")
+        def enqueue(kind):
+            if not self.video_url_link:
+                return
+            options = {'video_format': self.selected_format()} if kind == "mp4" else None
+            self.controller.enqueue(self.video_url_link, kind, title=self.title_video, options=options)
+            self.status_label.config(text=f"Queued ({kind}): {self.title_video[0:30]}", fg="white")
 
 
         # Create labels but store references
@@ -361,8 +800,28 @@ class DownloadsPage(tk.Frame):
         top_button_frame.pack(pady=10)
         
         # MP4 and MP3 buttons in top frame
-        tk.Button(top_button_frame, text="MP3 Download", width=15, command=download_audio).pack(side="left", padx=5)
+        self.audio_button = tk.Button(top_button_frame, text=f"{audio_label()} Download", width=15,
+                                      command=download_audio)
+        self.audio_button.pack(side="left", padx=5)
         tk.Button(top_button_frame, text="MP4 Download", width=15, command=download_video).pack(side="left", padx=5)
+
+        # resolution for mp4 downloads, filled in once the formats are probed
+        quality_frame = tk.Frame(self.center_frame, bg="gray")
+        quality_frame.pack(pady=5)
+        tk.Label(quality_frame, text="MP4 quality:", bg="gray").pack(side="left")
+        self.quality = tk.StringVar(value=default_quality_label)
+        self.quality_box = ttk.Combobox(quality_frame, textvariable=self.quality, state="readonly", width=28,
+                                        values=[default_quality_label])
+        self.quality_box.pack(side="left", padx=5)
+
+        # or add it to the download queue and keep browsing
+        queue_button_frame = tk.Frame(self.center_frame, bg="white")
+        queue_button_frame.pack(pady=5)
+
+        self.queue_audio_button = tk.Button(queue_button_frame, text=f"Queue {audio_label()}", width=15,
+                                            command=lambda: enqueue(audio_kind()))
+        self.queue_audio_button.pack(side="left", padx=5)
+        tk.Button(queue_button_frame, text="Queue MP4", width=15, command=lambda: enqueue("mp4")).pack(side="left", padx=5)
         
         # Back button in its own frame
         bottom_button_frame = tk.Frame(self.center_frame, bg="black")
@@ -371,19 +830,88 @@ class DownloadsPage(tk.Frame):
         tk.Button(bottom_button_frame, text="Back to Search Page",
                 command=lambda: self.controller.show_frame("SearchPage"),
                 width=32).pack()
+
+        # download settings
+        self.settings_frame = DownloadSettingsFrame(self.center_frame, bg="gray", on_change=self.update_audio_buttons)
+        self.settings_frame.pack(pady=5)
+
+        # Status label
+        self.status_label = tk.Label(self.center_frame, text="", 
+                                    font=("Arial", 12), bg="gray")
+        self.status_label.pack(pady=5)
+
+        # live progress of the last download started here
+        self.progress_view = ProgressView(self.center_frame, bg="gray")
+        self.progress_view.pack(pady=5)
     
 
+    def selected_format(self):
+        # yt-dlp format selector of the chosen quality, None for the default
+        for choice in self.format_choices:
+            if choice['label'] == self.quality.get():
+                return choice['format']
+        return None
+
+    def probe_formats(self):
+        self.format_choices = []
+        self.quality.set(default_quality_label)
+        self.quality_box.config(values=[default_quality_label, "Checking formats..."])
+
+        url = self.video_url_link
+        searcher = yt_search(url=url)
+        self.probe_jobs.submit(searcher.get_formats, name="probe formats",
+                               callback=lambda job: self.on_formats_probed(job, url))
+        self.pending_probes += 1
+        if self.pending_probes == 1:
+            self.poll_probe_jobs()
+
+    def poll_probe_jobs(self):
+        self.probe_jobs.poll()
+        if self.pending_probes:
+            self.after(poll_interval, self.poll_probe_jobs)
+
+    def on_formats_probed(self, job, url):
+        self.pending_probes -= 1
+
+        # another video may be on show by now
+        if url != self.video_url_link:
+            return
+
+        if job.status != "done":
+            print(f"Error probing formats: {job.error}")
+            self.quality_box.config(values=[default_quality_label])
+            return
+
+        self.format_choices = job.result or []
+        self.quality_box.config(values=[default_quality_label] + [choice['label'] for choice in self.format_choices])
+
+    def update_audio_buttons(self):
+        # the audio buttons say what the original audio switch will download
+        self.audio_button.config(text=f"{audio_label()} Download")
+        self.queue_audio_button.config(text=f"Queue {audio_label()}")
+
     def load_data(self, data):
         self.photo_url_link = data['photo_url']
         self.title_video = data['title']
-        self.photo_video = data['photo']
         self.video_url_link = data['video_url']
+        self.probe_formats()
         
-        # resize photo
-        self.photo_video = self.photo_video.resize((350, 200))
-
-        # store the photo
-        self.display_photo = ImageTk.PhotoImage(self.photo_video)
+        # the preview is normally already resized on disk, otherwise it is made from the search tile
+        cache = get_thumbnail_cache()
+        self.photo_video = cache.get(data.get('cache_key'), "preview")
+
+        if self.photo_video is None:
+            tile = cache.get(data.get('cache_key'), "tile")
+            if tile is not None:
+                self.photo_video = tile.resize(preview_size)
+                cache.put(data.get('cache_key'), "preview", self.photo_video)
+
+        # the thumbnail may have failed to load
+        if self.photo_video is not None:
+            # store the photo
+            self.display_photo = ImageTk.PhotoImage(self.photo_video)
+        else:
+            self.display_photo = ""
 
         # check if the title is less than 30, if not add ...
         if len(self.title_video) > 30:
@@ -421,14 +949,28 @@ class LinkPage(tk.Frame):
         self.url_entry.bind("<Return>", lambda e: self.process_link("mp3"))
         
         # Process buttons
-        tk.Button(container, text="Download mp3", 
-                 font=("Arial", font_size_normal),
-                 command=lambda: self.process_link("mp3")).pack(pady=10)
+        self.audio_button = tk.Button(container, text=f"Download {audio_label()}",
+                                      font=("Arial", font_size_normal),
+                                      command=lambda: self.process_link("mp3"))
+        self.audio_button.pack(pady=10)
         
         tk.Button(container, text="Download mp4", 
                  font=("Arial", font_size_normal),
                  command=lambda: self.process_link("mp4")).pack(pady=10)
+
+        queue_frame = tk.Frame(container, bg=triton_green)
+        queue_frame.pack(pady=5)
+        self.queue_audio_button = tk.Button(queue_frame, text=f"Queue {audio_label()}",
+                                            font=("Arial", font_size_normal),
+                                            command=lambda: self.enqueue_link(audio_kind()))
+        self.queue_audio_button.pack(side="left", padx=5)
+        tk.Button(queue_frame, text="Queue mp4", font=("Arial", font_size_normal),
+                  command=lambda: self.enqueue_link("mp4")).pack(side="left", padx=5)
         
+        # download settings
+        self.settings_frame = DownloadSettingsFrame(container, on_change=self.update_audio_buttons)
+        self.settings_frame.pack(pady=10)
+
         # Back button
         tk.Button(container, text="← Back to Home", 
                  font=("Arial", font_size_normal),
@@ -440,6 +982,11 @@ class LinkPage(tk.Frame):
                                     bg=triton_green)
         self.status_label.pack(pady=10)
 
+    def update_audio_buttons(self):
+        # the audio buttons say what the original audio switch will download
+        self.audio_button.config(text=f"Download {audio_label()}")
+        self.queue_audio_button.config(text=f"Queue {audio_label()}")
+
     def process_link(self, type):
         url = self.url_entry.get().strip()
         
@@ -455,11 +1002,11 @@ class LinkPage(tk.Frame):
             searcher = yt_search(url=url, path=output_path)
 
             if type == "mp3":
-                searcher.download_mp3()
+                searcher.submit(queue_actions[audio_kind()], callback=self.on_download_done)
             elif type == "mp4":
-                searcher.download_mp4()
+                searcher.submit("download_mp4", callback=self.on_download_done)
             
-            self.status_label.config(text="Link accepted!", fg="green")
+            self.status_label.config(text="Link accepted! Downloading...", fg="green")
             
             # Clear entry
             self.url_entry.delete(0, tk.END)
@@ -467,6 +1014,22 @@ class LinkPage(tk.Frame):
         except Exception as e:
             self.status_label.config(text=f"Error: {str(e)}", fg="red")
 
+    def enqueue_link(self, kind):
+        url = self.url_entry.get().strip()
+        if not url:
+            self.status_label.config(text="Please enter a URL", fg="red")
+            return
+
+        self.controller.enqueue(url, kind)
+        self.status_label.config(text="Added to the download queue", fg="green")
+        self.url_entry.delete(0, tk.END)
+
+    def on_download_done(self, job):
+        if job.status == "done" and job.result:
+            self.status_label.config(text="Download finished!", fg="green")
+        else:
+            self.status_label.config(text="Download failed", fg="red")
+
 
 class PlaylistPage(tk.Frame):
     def __init__(self, parent, controller):
@@ -495,14 +1058,25 @@ class PlaylistPage(tk.Frame):
         self.url_entry.bind("<Return>", lambda e: self.process_link("mp3"))
         
         # Process buttons
-        tk.Button(container, text="Download playlist as mp3", 
+        tk.Button(container, text="Download playlist audio", 
                  font=("Arial", font_size_normal),
                  command=lambda: self.process_link("mp3")).pack(pady=10)
         
         tk.Button(container, text="Download playlist as mp4", 
                  font=("Arial", font_size_normal),
                  command=lambda: self.process_link("mp4")).pack(pady=10)
+
+        queue_frame = tk.Frame(container, bg=triton_green)
+        queue_frame.pack(pady=5)
+        tk.Button(queue_frame, text="Queue playlist audio", font=("Arial", font_size_normal),
+                  command=lambda: self.enqueue_link("playlist-" + audio_kind('playlist_audio_mode'))).pack(side="left", padx=5)
+        tk.Button(queue_frame, text="Queue playlist as mp4", font=("Arial", font_size_normal),
+                  command=lambda: self.enqueue_link("playlist-mp4")).pack(side="left", padx=5)
         
+        # download settings
+        self.settings_frame = DownloadSettingsFrame(container, audio_setting='playlist_audio_mode')
+        self.settings_frame.pack(pady=10)
+
         # Back button
         tk.Button(container, text="← Back to Home", 
                  font=("Arial", font_size_normal),
@@ -514,6 +1088,10 @@ class PlaylistPage(tk.Frame):
                                     bg=triton_green)
         self.status_label.pack(pady=10)
 
+        # live progress of the playlist and the items downloading right now
+        self.progress_view = ProgressView(container, show_items=3, wraplength=500)
+        self.progress_view.pack(pady=10)
+
     def process_link(self, type):
         url = self.url_entry.get().strip()
         
@@ -529,14 +1107,195 @@ class PlaylistPage(tk.Frame):
             searcher = yt_search(url=url, path=output_path)
 
             if type == "mp3":
-                searcher.download_playlist_link_to_mp3()
+                # playlists keep the original audio format unless the settings say mp3
+                searcher.submit(queue_actions["playlist-" + audio_kind('playlist_audio_mode')],
+                                callback=self.on_download_done)
             elif type == "mp4":
-                searcher.download_playlist_link_to_mp4()
+                searcher.submit("download_playlist_link_to_mp4", callback=self.on_download_done)
+
+            self.progress_view.track(searcher.job_key)
             
-            self.status_label.config(text="Link accepted!", fg="green")
+            self.status_label.config(text="Link accepted! Downloading...", fg="green")
             
             # Clear entry
             self.url_entry.delete(0, tk.END)
             
         except Exception as e:
-            self.status_label.config(text=f"Error: {str(e)}", fg="red")
\ No newline at end of file
+            self.status_label.config(text=f"Error: {str(e)}", fg="red")
+
+    def enqueue_link(self, kind):
+        url = self.url_entry.get().strip()
+        if not url:
+            self.status_label.config(text="Please enter a URL", fg="red")
+            return
+
+        self.controller.enqueue(url, kind)
+        self.status_label.config(text="Added to the download queue", fg="green")
+        self.url_entry.delete(0, tk.END)
+
+    def on_download_done(self, job):
+        report = job.result
+        if job.status != "done" or not report:
+            self.status_label.config(text="Download failed", fg="red")
+        elif report['failed']:
+            self.status_label.config(text=f"Downloaded {report['succeeded']}/{report['total']}, "
+                                          f"{report['failed']} failed", fg="orange")
+        else:
+            self.status_label.config(text=f"Downloaded all {report['total']} videos!", fg="green")
+
+class QueuePage(tk.Frame):
+    '''
+    the download queue: what is waiting, running and finished
+
+    the list is read back from the job store every queue_pump_interval ms,
+    so it also shows jobs that were queued before the last restart
+    '''
+    def __init__(self, parent, controller):
+        super().__init__(parent)
+        self.controller = controller
+        self.queue = controller.queue
+        self.configure(bg=triton_green)
+
+        # ids of the jobs in the listbox, in the same order
+        self.job_ids = []
+        self.refresh_id = None
+
+        container = tk.Frame(self, bg=triton_green)
+        container.place(relx=0.5, rely=0.5, anchor="center")
+
+        tk.Label(container, text="Download Queue",
+                font=("Arial", font_size_large, "bold"),
+                bg=triton_green).pack(pady=(0, 20))
+
+        list_frame = tk.Frame(container, bg=triton_green)
+        list_frame.pack(pady=10)
+        scrollbar = tk.Scrollbar(list_frame, orient="vertical")
+        self.job_list = tk.Listbox(list_frame, width=60, height=15, font=("Arial", 12),
+                                   yscrollcommand=scrollbar.set, exportselection=False)
+        scrollbar.config(command=self.job_list.yview)
+        self.job_list.pack(side="left", fill="both")
+        scrollbar.pack(side="right", fill="y")
+
+        # move, pause, resume, cancel or remove the selected job
+        job_buttons = tk.Frame(container, bg=triton_green)
+        job_buttons.pack(pady=5)
+        for text, command in (("Up", lambda job_id: self.queue.move(job_id, 1)),
+                              ("Down", lambda job_id: self.queue.move(job_id, -1)),
+                              ("Pause", self.queue.pause),
+                              ("Resume", self.queue.resume),
+                              ("Cancel", self.queue.cancel),
+                              ("Remove", self.queue.remove)):
+            tk.Button(job_buttons, text=text, width=7,
+                      command=lambda command=command: self.on_job_button(command)).pack(side="left", padx=2)
+
+        tk.Button(container, text="Clear finished", font=("Arial", font_size_normal),
+                  command=self.clear_finished).pack(pady=5)
+
+        # limits for the whole queue
+        limits_frame = tk.Frame(container, bg=triton_green)
+        limits_frame.pack(pady=10)
+
+        self.max_concurrent = tk.IntVar(value=self.queue.max_concurrent)
+        tk.Label(limits_frame, text="Downloads at once:", bg=triton_green).pack(side="left")
+        tk.Spinbox(limits_frame, from_=1, to=max_queue_concurrent, width=3, textvariable=self.max_concurrent,
+                   command=self.apply_limits).pack(side="left", padx=5)
+
+        # bandwidth limits cover every download in the app, not just the queue
+        bandwidth_frame = tk.Frame(container, bg=triton_green)
+        bandwidth_frame.pack(pady=5)
+
+        self.bandwidth_limit = tk.StringVar(value=str(self.queue.bandwidth_limit // 1024))
+        self.job_bandwidth_limit = tk.StringVar(value=str(self.queue.job_bandwidth_limit // 1024))
+        for text, variable in (("Total KiB/s:", self.bandwidth_limit), ("Per download KiB/s:", self.job_bandwidth_limit)):
+            tk.Label(bandwidth_frame, text=text, bg=triton_green).pack(side="left")
+            bandwidth_entry = tk.Entry(bandwidth_frame, width=7, textvariable=variable)
+            bandwidth_entry.pack(side="left", padx=5)
+            bandwidth_entry.bind("<Return>", lambda e: self.apply_limits())
+        tk.Button(bandwidth_frame, text="Apply", command=self.apply_limits).pack(side="left")
+        tk.Label(container, text="0 = no limit", bg=triton_green).pack()
+
+        # Status label
+        self.status_label = tk.Label(container, text="",
+                                    font=("Arial", 12),
+                                    bg=triton_green)
+        self.status_label.pack(pady=10)
+
+        # Back button
+        tk.Button(container, text="← Back to Home",
+                 font=("Arial", font_size_normal),
+                 command=lambda: controller.show_frame("HomePage")).pack(pady=20)
+
+    def selected_job(self):
+        selection = self.job_list.curselection()
+        if not selection or selection[0] >= len(self.job_ids):
+            return None
+        return self.job_ids[selection[0]]
+
+    def on_job_button(self, command):
+        job_id = self.selected_job()
+        if job_id is None:
+            self.status_label.config(text="Select a download first", fg="red")
+            return
+
+        command(job_id)
+        self.status_label.config(text="", fg="white")
+        self.refresh_list()
+
+    def clear_finished(self):
+        self.queue.remove_finished()
+        self.refresh_list()
+
+    def apply_limits(self):
+        try:
+            self.queue.set_max_concurrent(int(self.max_concurrent.get()))
+            self.queue.set_bandwidth_limit(int(float(self.bandwidth_limit.get() or 0) * 1024),
+                                           int(float(self.job_bandwidth_limit.get() or 0) * 1024))
+        except (tk.TclError, ValueError):
+            self.status_label.config(text="Limits must be numbers", fg="red")
+            return
+
+        self.max_concurrent.set(self.queue.max_concurrent)
+        self.status_label.config(text="Limits saved, running downloads follow the new bandwidth limits",
+                                 fg="white")
+
+    def describe_job(self, job):
+        text = f"[{job['state']}] {job['kind']}  {(job['title'] or job['url'])[0:40]}"
+        if job['priority']:
+            text += f"  (priority {job['priority']:+d})"
+
+        if job['state'] == "running":
+            event = self.queue.latest_progress(job['id'])
+            if event:
+                text += f"  {describe_progress(event)}"
+        elif job['state'] == "failed" and job['error']:
+            text += f"  {job['error'][0:40]}"
+        return text
+
+    def refresh_list(self):
+        selected = self.selected_job()
+        scrolled_to = self.job_list.yview()[0]
+        jobs = self.queue.jobs()
+
+        self.job_list.delete(0, tk.END)
+        for job in jobs:
+            self.job_list.insert(tk.END, self.describe_job(job))
+        self.job_ids = [job['id'] for job in jobs]
+
+        # keep the same job selected after the list is rebuilt
+        if selected in self.job_ids:
+            self.job_list.selection_set(self.job_ids.index(selected))
+        self.job_list.yview_moveto(scrolled_to)
+
+    def on_show(self):
+        if self.refresh_id is None:
+            self.refresh()
+
+    def on_hide(self):
+        # no point reading the queue every second while nobody looks at it
+        if self.refresh_id is not None:
+            self.after_cancel(self.refresh_id)
+            self.refresh_id = None
+
+    def refresh(self):
+        self.refresh_list()
+        self.refresh_id = self.after(queue_pump_interval, self.refresh)
@@ -0,0 +1,262 @@
+import atexit
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("yt_searcher.instrumentation")
+
+# set YT_METRICS to jsonl or prometheus to turn this on, YT_METRICS_FILE says where it goes
+env_mode = "YT_METRICS"
+env_file = "YT_METRICS_FILE"
+
+default_prometheus_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "metrics.prom")
+
+# the prometheus file is rewritten at most this often (seconds), and once more at exit
+prometheus_interval = 5.0
+
+modes = {
+    '': None, '0': None, 'off': None, 'false': None, 'none': None,
+    '1': "jsonl", 'on': "jsonl", 'true': "jsonl", 'json': "jsonl", 'jsonl': "jsonl",
+    'prom': "prometheus", 'prometheus': "prometheus",
+}
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Span():
+    # one timed stage, extra fields only go to the JSON lines output
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.fields = {}
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+
+class _NullSpan():
+    def set(self, **fields):
+        pass
+
+
+_null_span = _NullSpan()
+
+
+class JsonLinesLogHandler(logging.Handler):
+    # log records go to the same JSON lines stream as the spans
+    def __init__(self, instrumentation):
+        super().__init__()
+        self.instrumentation = instrumentation
+
+    def emit(self, record):
+        self.instrumentation.emit({
+            'type': "log",
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'message': record.getMessage(),
+        })
+
+
+class Instrumentation():
+    '''
+    timing spans and counters for the download pipeline
+
+    off unless YT_METRICS is "jsonl" or "prometheus". jsonl writes one line
+    per span, counter and log record to YT_METRICS_FILE (stderr by default),
+    prometheus keeps totals and rewrites a text file (metrics.prom by
+    default) for the node exporter's textfile collector
+
+    labels become prometheus series, so they should only take a few values
+    (profile, status, postprocessor), anything else belongs in span.set()
+    '''
+    def __init__(self, mode=None, path=None):
+        self._lock = threading.Lock()
+        self._stream = None
+        self._log_handler = None
+        self._set_level = False
+        self._last_write = 0.0
+        self.counters = {}
+        self.spans = {}
+        self.mode = None
+        self.path = None
+        self.configure(mode, path)
+        atexit.register(self.flush)
+
+    def configure(self, mode=None, path=None):
+        key = (mode or "").strip().lower()
+        if key not in modes:
+            raise ValueError(f"Unknown metrics mode: {mode}")
+
+        with self._lock:
+            if self._stream is not None and self._stream is not sys.stderr:
+                self._stream.close()
+            self._stream = None
+            self.mode = modes[key]
+            self.path = path
+
+        # errors and state from the download code land in the same stream, info records
+        # (like skipped downloads) too, unless the app already picked a level
+        package_logger = logging.getLogger("yt_searcher")
+        if self._log_handler is not None:
+            package_logger.removeHandler(self._log_handler)
+            self._log_handler = None
+            if self._set_level:
+                package_logger.setLevel(logging.NOTSET)
+                self._set_level = False
+        if self.mode == "jsonl":
+            self._log_handler = JsonLinesLogHandler(self)
+            package_logger.addHandler(self._log_handler)
+            if package_logger.level == logging.NOTSET:
+                package_logger.setLevel(logging.INFO)
+                self._set_level = True
+
+    @property
+    def enabled(self):
+        return self.mode is not None
+
+    @contextmanager
+    def span(self, name, **labels):
+        if not self.enabled:
+            yield _null_span
+            return
+
+        span = Span(name, labels)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=str(e))
+            self.record_span(name, time.perf_counter() - started, status="error", fields=span.fields, **labels)
+            raise
+        self.record_span(name, time.perf_counter() - started, fields=span.fields, **labels)
+
+    def record_span(self, name, seconds, status="ok", fields=None, **labels):
+        if not self.enabled:
+            return
+
+        key = (name, status, tuple(sorted(labels.items())))
+        with self._lock:
+            totals = self.spans.setdefault(key, {'count': 0, 'sum': 0.0, 'max': 0.0})
+            totals['count'] += 1
+            totals['sum'] += seconds
+            totals['max'] = max(totals['max'], seconds)
+
+        self.emit({'type': "span", 'name': name, 'status': status, 'seconds': round(seconds, 6),
+                   **labels, **(fields or {})})
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+        self.emit({'type': "counter", 'name': name, 'value': value, **labels})
+
+    def emit(self, record):
+        if self.mode == "jsonl":
+            line = json.dumps({'time': round(time.time(), 3), **record}, default=str)
+            with self._lock:
+                if self._stream is None:
+                    self._stream = open(self.path, "a", encoding="utf-8") if self.path else sys.stderr
+                self._stream.write(line + "\n")
+                self._stream.flush()
+        elif self.mode == "prometheus":
+            if time.monotonic() - self._last_write >= prometheus_interval:
+                self.flush()
+
+    def prometheus_text(self):
+        def label_text(labels):
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels) + "}"
+
+        with self._lock:
+            counters = dict(self.counters)
+            spans = {key: dict(totals) for key, totals in self.spans.items()}
+
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE yt_{name}_total counter")
+            lines.append(f"yt_{name}_total{label_text(labels)} {value}")
+
+        def series(name, status, labels):
+            return label_text((('span', name), ('status', status)) + labels)
+
+        # a summary may only have _count and _sum, the slowest span is a gauge of its own
+        lines.append("# TYPE yt_span_seconds summary")
+        for (name, status, labels), totals in sorted(spans.items()):
+            lines.append(f"yt_span_seconds_count{series(name, status, labels)} {totals['count']}")
+            lines.append(f"yt_span_seconds_sum{series(name, status, labels)} {totals['sum']:.6f}")
+
+        lines.append("# TYPE yt_span_max_seconds gauge")
+        for (name, status, labels), totals in sorted(spans.items()):
+            lines.append(f"yt_span_max_seconds{series(name, status, labels)} {totals['max']:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        if self.mode != "prometheus":
+            return
+
+        # written to a temp file first so a scraper never reads half a file
+        path = self.path or default_prometheus_file
+        self._last_write = time.monotonic()
+        try:
+            temp_path = f"{path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.error(f"Error writing metrics: {e}")
+
+
+def stage_hooks(progress_hook, postprocessor_hook, **labels):
+    '''
+    wraps yt-dlp hooks so the network transfer of every file and every post
+    processor (Merger is the DASH merge) get their own span
+    '''
+    if not instrumentation.enabled:
+        return progress_hook, postprocessor_hook
+
+    mark = [time.perf_counter()]
+    postprocessors_started = {}
+
+    def on_progress(d):
+        if d.get('status') == "finished":
+            now = time.perf_counter()
+            instrumentation.record_span("transfer", now - mark[0], **labels)
+            instrumentation.count("downloaded_bytes", d.get('total_bytes') or d.get('downloaded_bytes') or 0, **labels)
+            mark[0] = now
+        progress_hook(d)
+
+    def on_postprocessor(d):
+        name = d.get('postprocessor') or "unknown"
+        if d.get('status') == "started":
+            postprocessors_started[name] = time.perf_counter()
+        elif d.get('status') == "finished" and name in postprocessors_started:
+            instrumentation.record_span("postprocess", time.perf_counter() - postprocessors_started.pop(name),
+                                        postprocessor=name, **labels)
+        postprocessor_hook(d)
+
+    return on_progress, on_postprocessor
+
+
+instrumentation = Instrumentation(os.environ.get(env_mode), os.environ.get(env_file))
+
+
+def span(name, **labels):
+    return instrumentation.span(name, **labels)
+
+
+def count(name, value=1, **labels):
+    instrumentation.count(name, value, **labels)
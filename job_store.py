@@ -0,0 +1,169 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+store_filename = ".download_queue.sqlite3"
+
+# states a queued job moves through
+active_states = ("queued", "running")
+finished_states = ("done", "failed", "cancelled")
+
+
+class JobStore():
+    '''
+    sqlite table of queued downloads, so the queue survives a restart
+
+    every job has a url, a kind (mp3, audio, mp4, playlist-mp3, ...), the
+    directory it downloads into, a priority and a state. higher priorities
+    go first, jobs with the same priority go in the order they were added
+
+    options holds the download options of a job (like the video format)
+    as JSON. a small settings table keeps the queue limits between runs
+
+    the GUI and the server can share one store. a job is claimed with a
+    single UPDATE, and a running job records its owner and when that owner
+    last sent a heartbeat, so only jobs whose owner went away are requeued
+    '''
+    def __init__(self, directory):
+        self.path = os.path.join(directory, store_filename)
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    title TEXT,
+                    kind TEXT NOT NULL,
+                    output_dir TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    state TEXT NOT NULL,
+                    error TEXT,
+                    options TEXT,
+                    owner TEXT,
+                    heartbeat REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            # stores made before jobs had options or owners
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+            for column, column_type in (('options', "TEXT"), ('owner', "TEXT"), ('heartbeat', "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def add(self, url, kind, output_dir, title=None, priority=0, options=None):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (url, title, kind, output_dir, priority, state, options, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (url, title, kind, output_dir, priority, json.dumps(options or {}), now, now))
+            return cursor.lastrowid
+
+    def get(self, job_id):
+        jobs = self._select("WHERE id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def jobs(self):
+        # everything, in the order the queue would run it
+        return self._select("ORDER BY state = 'running' DESC, priority DESC, id")
+
+    def next_queued(self, limit=1):
+        return self._select("WHERE state = 'queued' ORDER BY priority DESC, id LIMIT ?", (limit,))
+
+    def _select(self, clause, params=()):
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, url, title, kind, output_dir, priority, state, error, options, owner, created_at, updated_at "
+                f"FROM jobs {clause}", params).fetchall()
+
+        keys = ('id', 'url', 'title', 'kind', 'output_dir', 'priority', 'state', 'error', 'options', 'owner',
+                'created_at', 'updated_at')
+        jobs = [dict(zip(keys, row)) for row in rows]
+        for job in jobs:
+            job['options'] = json.loads(job['options'] or "{}")
+        return jobs
+
+    def set_state(self, job_id, state, error=None):
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE id = ?",
+                         (state, error, time.time(), job_id))
+
+    def claim(self, job_id, owner):
+        # False when another process got the job first
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = 'running', error = NULL, owner = ?, heartbeat = ?, updated_at = ? "
+                "WHERE id = ? AND state = 'queued'", (owner, now, now, job_id))
+            return cursor.rowcount == 1
+
+    def heartbeat(self, owner):
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE jobs SET heartbeat = ? WHERE owner = ? AND state = 'running'", (time.time(), owner))
+
+    def set_priority(self, job_id, priority):
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE jobs SET priority = ?, updated_at = ? WHERE id = ?",
+                         (priority, time.time(), job_id))
+
+    def set_title(self, job_id, title):
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE jobs SET title = ? WHERE id = ?", (title, job_id))
+
+    def remove(self, job_id):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def remove_finished(self):
+        with self._lock, self._connect() as conn:
+            conn.execute(f"DELETE FROM jobs WHERE state IN ({', '.join('?' * len(finished_states))})",
+                         finished_states)
+
+    def requeue_running(self, lease_timeout):
+        # running jobs whose owner sent no heartbeat for lease_timeout seconds (it closed or
+        # crashed) go back in the queue, jobs another process is still running stay where they are
+        stale = "state = 'running' AND (heartbeat IS NULL OR heartbeat < ?)"
+        requeued = []
+        for job in self._select(f"WHERE {stale}", (time.time() - lease_timeout,)):
+            with self._lock, self._connect() as conn:
+                cursor = conn.execute(f"UPDATE jobs SET state = 'queued', owner = NULL, updated_at = ? "
+                                      f"WHERE id = ? AND {stale}",
+                                      (time.time(), job['id'], time.time() - lease_timeout))
+            if cursor.rowcount == 1:
+                requeued.append(job)
+        return requeued
+
+    def get_setting(self, key, default=None):
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_setting(self, key, value):
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_job_store(directory):
+    # one store per directory
+    key = os.path.abspath(directory)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = JobStore(key)
+        return _stores[key]
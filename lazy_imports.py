@@ -0,0 +1,47 @@
+import importlib
+import logging
+import threading
+
+logger = logging.getLogger("yt_searcher.lazy_imports")
+
+
+class LazyModule():
+    '''
+    stands in for a module until one of its attributes is used
+
+    yt_dlp, PIL and requests take a long time to import, this keeps them
+    out of startup while the rest of the code still reads yt_dlp.YoutubeDL
+    '''
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name} ({state})>"
+
+
+def lazy_module(name):
+    return LazyModule(name)
+
+
+def prewarm(*modules):
+    # import the heavy modules on a background thread so they are ready when needed
+    def run():
+        for module in modules:
+            try:
+                module.load()
+            except ImportError as e:
+                logger.error(f"Error importing {module._name}: {e}")
+
+    thread = threading.Thread(target=run, name="prewarm", daemon=True)
+    thread.start()
+    return thread
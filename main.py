@@ -1,4 +1,9 @@
+import logging
+
 from gui import App
 
-app = App()
-app.mainloop()
\ No newline at end of file
+# the transcode pool starts worker processes that import this file again
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    app = App()
+    app.mainloop()
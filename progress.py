@@ -0,0 +1,223 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger("yt_searcher.progress")
+
+# downloading events for one job are published at most this often (seconds)
+default_min_interval = 0.2
+
+# a job's last event and cancel flag are kept this long (seconds) after it ends, then forgotten
+finished_retention = 5 * 60
+
+# statuses that end a job
+final_statuses = ("finished", "error", "cancelled")
+
+
+class DownloadCancelled(Exception):
+    # raised from the yt-dlp hooks to stop a download that was paused or cancelled
+    pass
+
+
+def format_bytes(num):
+    if num is None:
+        return "?"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if num < 1024 or unit == "GiB":
+            return f"{num:.1f}{unit}" if unit != "B" else f"{int(num)}B"
+        num /= 1024
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def describe_progress(event):
+    # one line of text for a progress event
+    if event is None:
+        return ""
+
+    status = event.get('status')
+    if status == "downloading":
+        text = "Downloading"
+        if event.get('total_bytes'):
+            percent = 100 * event['downloaded_bytes'] / event['total_bytes']
+            text += f" {percent:.1f}% of {format_bytes(event['total_bytes'])}"
+        else:
+            text += f" {format_bytes(event.get('downloaded_bytes'))}"
+        if event.get('speed'):
+            text += f" at {format_bytes(event['speed'])}/s"
+        if event.get('eta') is not None:
+            text += f", ETA {format_eta(event['eta'])}"
+        if event.get('fragment_count'):
+            text += f" (fragment {event.get('fragment_index') or 0}/{event['fragment_count']})"
+        return text
+    if status == "downloaded":
+        return "Downloaded, processing..."
+    if status == "postprocessing":
+        return f"Processing ({event.get('phase') or 'ffmpeg'})..."
+    if status == "playlist_progress":
+        return f"{event.get('completed')}/{event.get('total')} videos done"
+    if status == "finished":
+        return "Skipped, already downloaded" if event.get('skipped') else "Finished"
+    if status == "cancelled":
+        return "Cancelled"
+    if status == "error":
+        return f"Error: {event.get('error') or 'download failed'}"
+    return str(status)
+
+
+class ProgressBus():
+    '''
+    fan out of download progress events to anyone subscribed
+
+    events are plain dicts with at least 'job' and 'status'. downloading
+    events for the same job are throttled to min_interval, the latest event
+    of every job is kept so a GUI can poll it on its own schedule
+
+    a job can also be asked to stop with cancel(), its hooks then raise
+    DownloadCancelled the next time yt-dlp reports progress
+
+    once a job ends, its state is kept for finished_retention seconds so
+    pages can still show how it ended, and then dropped
+    '''
+    def __init__(self, min_interval=default_min_interval, retention=finished_retention):
+        self.min_interval = min_interval
+        self.retention = retention
+        self._subscribers = []
+        self._latest = {}
+        self._last_published = {}
+        self._cancelled = {}
+        self._ended = {}
+        self._last_prune = time.monotonic()
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def publish(self, event):
+        job = event.get('job')
+        now = time.monotonic()
+
+        with self._lock:
+            self._latest[job] = event
+            if event.get('status') in final_statuses:
+                self._ended[job] = now
+            else:
+                self._ended.pop(job, None)
+            if now - self._last_prune >= self.retention / 10:
+                self._prune(now)
+
+            # downloading events come very often, only pass some of them on
+            if event.get('status') == "downloading":
+                if now - self._last_published.get(job, 0) < self.min_interval:
+                    return
+            self._last_published[job] = now
+            subscribers = list(self._subscribers)
+
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.exception(f"Error in progress subscriber: {e}")
+
+    def latest(self, job):
+        with self._lock:
+            return self._latest.get(job)
+
+    def latest_children(self, parent):
+        # latest event of every job that belongs to parent (playlist items)
+        with self._lock:
+            return [event for event in self._latest.values() if event.get('parent') == parent]
+
+    def _prune(self, now):
+        # called with the lock held
+        self._last_prune = now
+        expired = [job for job, ended in self._ended.items() if now - ended >= self.retention]
+        expired += [job for job, cancelled in self._cancelled.items()
+                    if now - cancelled >= self.retention and job not in self._latest]
+        for job in expired:
+            self._forget(job)
+
+    def cancel(self, job):
+        with self._lock:
+            self._cancelled[job] = time.monotonic()
+
+    def uncancel(self, job):
+        with self._lock:
+            self._cancelled.pop(job, None)
+
+    def is_cancelled(self, job, parent=None):
+        with self._lock:
+            return job in self._cancelled or (parent is not None and parent in self._cancelled)
+
+    def forget(self, job):
+        with self._lock:
+            self._forget(job)
+
+    def _forget(self, job):
+        self._latest.pop(job, None)
+        self._last_published.pop(job, None)
+        self._ended.pop(job, None)
+        self._cancelled.pop(job, None)
+        for key in [key for key, event in self._latest.items() if event.get('parent') == job]:
+            self._latest.pop(key, None)
+            self._last_published.pop(key, None)
+            self._ended.pop(key, None)
+
+
+def make_hooks(bus, job, parent=None, title=None):
+    # yt-dlp progress_hooks/postprocessor_hooks that publish onto the bus
+    def check_cancelled():
+        if bus.is_cancelled(job, parent):
+            raise DownloadCancelled(f"Download cancelled: {title or job}")
+
+    def progress_hook(d):
+        check_cancelled()
+
+        # yt-dlp says finished once a file is on disk, the job itself may still be post processing
+        status = d.get('status')
+        if status == "finished":
+            status = "downloaded"
+
+        bus.publish({
+            'job': job,
+            'parent': parent,
+            'title': title,
+            'status': status,
+            'downloaded_bytes': d.get('downloaded_bytes'),
+            'total_bytes': d.get('total_bytes') or d.get('total_bytes_estimate'),
+            'speed': d.get('speed'),
+            'eta': d.get('eta'),
+            'fragment_index': d.get('fragment_index'),
+            'fragment_count': d.get('fragment_count'),
+            'filename': d.get('filename'),
+        })
+
+    def postprocessor_hook(d):
+        check_cancelled()
+        if d.get('status') == "finished":
+            return
+        bus.publish({
+            'job': job,
+            'parent': parent,
+            'title': title,
+            'status': "postprocessing",
+            'phase': d.get('postprocessor'),
+        })
+
+    return progress_hook, postprocessor_hook
+
+
+progress_bus = ProgressBus()
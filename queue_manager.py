@@ -0,0 +1,297 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from download_scheduler import DownloadScheduler
+from download_index import get_download_index
+from job_store import get_job_store, active_states
+from progress import progress_bus
+from rate_limits import bandwidth_governor
+
+logger = logging.getLogger("yt_searcher.queue")
+
+# downloads the queue runs at the same time by default, and at most
+default_max_concurrent = 2
+max_queue_concurrent = 8
+
+# seconds between heartbeats of running jobs, and after how long without one a
+# job counts as left behind by a process that closed or crashed
+heartbeat_interval = 10
+lease_timeout = 60
+
+# which yt_search method runs each kind of job
+queue_actions = {
+    'mp3': 'download_mp3',
+    'audio': 'download_original_audio',
+    'mp4': 'download_mp4',
+    'playlist-mp3': 'download_playlist_link_to_mp3',
+    'playlist-audio': 'download_playlist_link_to_audio',
+    'playlist-mp4': 'download_playlist_link_to_mp4',
+}
+
+
+# download options a queued job can carry, they are passed on to yt_search
+queue_options = ('video_format',)
+
+
+def queue_job_key(job_id):
+    # progress events and cancellation of a queued job use this key
+    return f"queue:{job_id}"
+
+
+class QueueManager():
+    '''
+    runs the jobs of a JobStore on a scheduler, highest priority first
+
+    at most max_concurrent jobs run at once. pause and cancel ask the
+    running download to stop through the progress bus, a paused job keeps
+    its .part file and continues from there once it is resumed
+
+    bandwidth_limit and job_bandwidth_limit (bytes per second, 0 for none)
+    are handed to the process wide bandwidth governor, so they cover every
+    download in the app and changes apply to running jobs right away
+
+    pump() starts whatever can start, call it from the thread that polls
+    the scheduler (the GUI calls both from its after() loop). it also sends
+    the heartbeats of the running jobs and requeues jobs other processes
+    sharing the store left behind
+    '''
+    def __init__(self, store, scheduler=None, max_concurrent=None, bandwidth_limit=None, job_bandwidth_limit=None):
+        self.store = store
+        self.scheduler = scheduler or DownloadScheduler(max_workers=max_queue_concurrent)
+        self.max_concurrent = max_concurrent or self._setting('max_concurrent', default_max_concurrent)
+        if bandwidth_limit is None:
+            bandwidth_limit = self._setting('bandwidth_limit', 0)
+        if job_bandwidth_limit is None:
+            job_bandwidth_limit = self._setting('job_bandwidth_limit', 0)
+        bandwidth_governor.set_limits(bandwidth_limit, job_bandwidth_limit)
+
+        # queue job id -> DownloadJob of the scheduler
+        self.running = {}
+        # jobs that were resumed or removed while their old download was still
+        # stopping, handled once that download has finished
+        self._resume_after = set()
+        self._remove_after = set()
+        self._lock = threading.Lock()
+
+        # a GUI and a server can share the store, their running jobs are told apart by owner
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._last_heartbeat = 0.0
+        self._requeue_stale()
+
+    def _setting(self, key, default):
+        try:
+            return int(self.store.get_setting(key, default))
+        except ValueError:
+            return default
+
+    def _requeue_stale(self):
+        # anything that was running when the app closed starts again, and is
+        # taken out of the download index's pending list so it only runs once
+        for job in self.store.requeue_running(lease_timeout):
+            self._clear_pending(job)
+
+    def _keep_leases(self):
+        if time.monotonic() - self._last_heartbeat < heartbeat_interval:
+            return
+        self._last_heartbeat = time.monotonic()
+        self.store.heartbeat(self.owner)
+        self._requeue_stale()
+
+    def _clear_pending(self, job):
+        try:
+            get_download_index(job['output_dir']).clear_pending(job['url'], job['kind'])
+        except Exception as e:
+            logger.error(f"Error clearing the pending entry of queue job {job['id']}: {e}")
+
+    def enqueue(self, url, kind, output_dir, title=None, priority=0, options=None):
+        if kind not in queue_actions:
+            raise ValueError(f"Unknown download kind: {kind}")
+
+        options = {key: value for key, value in (options or {}).items() if value is not None}
+        unknown = set(options) - set(queue_options)
+        if unknown:
+            raise ValueError(f"Unknown download options: {', '.join(sorted(unknown))}")
+
+        return self.store.add(url, kind, output_dir, title=title, priority=priority, options=options)
+
+    def jobs(self):
+        return self.store.jobs()
+
+    def set_max_concurrent(self, max_concurrent):
+        self.max_concurrent = min(max(1, int(max_concurrent)), self.scheduler.max_workers)
+        self.store.set_setting('max_concurrent', self.max_concurrent)
+
+    @property
+    def bandwidth_limit(self):
+        return bandwidth_governor.total_limit
+
+    @property
+    def job_bandwidth_limit(self):
+        return bandwidth_governor.job_limit
+
+    def set_bandwidth_limit(self, bytes_per_second=None, job_bytes_per_second=None):
+        # None leaves a limit as it is
+        bandwidth_governor.set_limits(bytes_per_second, job_bytes_per_second)
+        self.store.set_setting('bandwidth_limit', self.bandwidth_limit)
+        self.store.set_setting('job_bandwidth_limit', self.job_bandwidth_limit)
+
+    def move(self, job_id, steps):
+        job = self.store.get(job_id)
+        if job:
+            self.store.set_priority(job_id, job['priority'] + steps)
+
+    def pause(self, job_id):
+        self._stop(job_id, "paused")
+
+    def cancel(self, job_id):
+        self._stop(job_id, "cancelled")
+
+    def _stop(self, job_id, state):
+        job = self.store.get(job_id)
+        # a paused job can still be cancelled
+        if job is None or job['state'] not in active_states + ("paused",):
+            return
+
+        self.store.set_state(job_id, state)
+        with self._lock:
+            is_running = job_id in self.running
+            self._resume_after.discard(job_id)
+        if is_running:
+            progress_bus.cancel(queue_job_key(job_id))
+
+    def resume(self, job_id):
+        job = self.store.get(job_id)
+        if not job or job['state'] not in ("paused", "failed", "cancelled"):
+            return
+
+        with self._lock:
+            if job_id in self.running:
+                # the old download has not noticed the pause yet, it is queued again once it stops
+                self._resume_after.add(job_id)
+                return
+        self.store.set_state(job_id, "queued")
+
+    def remove(self, job_id):
+        self.cancel(job_id)
+        with self._lock:
+            if job_id in self.running:
+                # the row goes once the download has stopped
+                self._remove_after.add(job_id)
+                return
+        self.store.remove(job_id)
+
+    def remove_finished(self):
+        self.store.remove_finished()
+
+    def pump(self):
+        self._keep_leases()
+        with self._lock:
+            free = self.max_concurrent - len(self.running)
+        if free <= 0:
+            return []
+
+        with self._lock:
+            running = set(self.running)
+
+        # a job that is still running is never started a second time
+        started = []
+        for job in self.store.next_queued(free + len(running)):
+            if len(started) >= free:
+                break
+            if job['id'] not in running:
+                download = self._start(job)
+                if download is not None:
+                    started.append(download)
+        return started
+
+    def _start(self, job):
+        # imported here so the queue can be built before yt_dlp is needed
+        from yt_searcher import yt_search
+
+        key = queue_job_key(job['id'])
+        with self._lock:
+            if job['id'] in self.running:
+                return self.running[job['id']]
+        if not self.store.claim(job['id'], self.owner):
+            # another process sharing the store started it
+            return None
+        progress_bus.uncancel(key)
+        progress_bus.forget(key)
+
+        options = {key: value for key, value in job['options'].items() if key in queue_options}
+        searcher = yt_search(url=job['url'], title=job['title'], path=job['output_dir'],
+                             job_key=key, **options)
+        download = searcher.submit(queue_actions[job['kind']], scheduler=self.scheduler,
+                                   callback=lambda download, job_id=job['id']: self._finished(job_id, download))
+        with self._lock:
+            self.running[job['id']] = download
+        return download
+
+    def _finished(self, job_id, download):
+        with self._lock:
+            self.running.pop(job_id, None)
+            resume = job_id in self._resume_after
+            remove = job_id in self._remove_after
+            self._resume_after.discard(job_id)
+            self._remove_after.discard(job_id)
+
+        key = queue_job_key(job_id)
+        was_stopped = progress_bus.is_cancelled(key)
+        progress_bus.uncancel(key)
+
+        job = self.store.get(job_id)
+        if job is not None:
+            self._record_outcome(job, download, was_stopped)
+            if remove:
+                self.store.remove(job_id)
+            elif resume:
+                self.store.set_state(job_id, "queued")
+
+        self.pump()
+
+    def _record_outcome(self, job, download, was_stopped):
+        job_id = job['id']
+
+        # the queue owns this download now, resume_pending_downloads should not start it too
+        self._clear_pending(job)
+
+        if was_stopped:
+            # paused or cancelled while running, the state was already set
+            if job['state'] == "running":
+                self.store.set_state(job_id, "cancelled")
+            return
+
+        result = download.result
+        ok = download.status == "done" and bool(result) and not (isinstance(result, dict) and result.get('failed'))
+        if ok:
+            self.store.set_state(job_id, "done")
+        else:
+            error = download.error or (isinstance(result, dict) and f"{result['failed']} of {result['total']} failed") or None
+            self.store.set_state(job_id, "failed", str(error) if error else "Download failed")
+
+    def latest_progress(self, job_id):
+        return progress_bus.latest(queue_job_key(job_id))
+
+    def shutdown(self):
+        # running jobs stop where they are and continue on the next start
+        with self._lock:
+            running = list(self.running)
+        for job_id in running:
+            progress_bus.cancel(queue_job_key(job_id))
+        self.scheduler.shutdown(wait=False)
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_queue_manager(directory):
+    # one queue per directory the store lives in
+    store = get_job_store(directory)
+    with _managers_lock:
+        if store.path not in _managers:
+            _managers[store.path] = QueueManager(store)
+        return _managers[store.path]
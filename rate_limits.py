@@ -0,0 +1,197 @@
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from instrumentation import count
+
+
+class HostRateLimiter():
+    '''
+    limits how many jobs can talk to one host at the same time, and how
+    quickly new jobs may start against it (min_interval seconds apart)
+    '''
+    def __init__(self, max_per_host=4, min_interval=0.0):
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self._semaphores = {}
+        self._last_start = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+
+    def _wait_for_turn(self, host):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._last_start.get(host, 0) + self.min_interval - now
+                if wait <= 0:
+                    self._last_start[host] = now
+                    return
+            time.sleep(wait)
+
+    @contextmanager
+    def limit(self, url):
+        host = urlparse(url).netloc.lower() if url else ""
+        semaphore = self._semaphore(host)
+
+        with semaphore:
+            if self.min_interval:
+                self._wait_for_turn(host)
+            yield
+
+
+# how long one wait inside a progress hook lasts at most, so limit changes and
+# cancellation are noticed quickly
+throttle_step = 0.25
+
+# per job buckets that have not been used for this long are dropped
+idle_bucket_age = 60.0
+
+rate_units = {'': 1, 'b': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_rate(text):
+    # "500K", "2M", "1.5m" or plain bytes per second, like yt-dlp's --limit-rate. 0 means no limit
+    value = str(text).strip().lower().removesuffix("/s").removesuffix("ib").removesuffix("b")
+    unit = value[-1:] if value[-1:] in rate_units else ''
+    number = value[:len(value) - len(unit)]
+    try:
+        rate = float(number) * rate_units[unit]
+    except ValueError:
+        raise ValueError(f"Not a rate: {text}")
+    if rate < 0:
+        raise ValueError(f"Not a rate: {text}")
+    return int(rate)
+
+
+class TokenBucket():
+    '''
+    bytes per second limit, rate 0 means no limit
+
+    take() always succeeds and may leave the bucket in debt, whoever took
+    the bytes then waits until the debt is paid off. the bucket holds at
+    most one second worth of bytes so an idle job can not save up a burst
+    '''
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.tokens = float(rate)
+        self.last_used = time.monotonic()
+        self._updated = self.last_used
+
+    def set_rate(self, rate):
+        self._refill()
+        self.rate = rate
+        self.tokens = min(self.tokens, float(rate))
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(float(self.rate), self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, amount):
+        self._refill()
+        self.last_used = self._updated
+        if self.rate:
+            self.tokens -= amount
+
+    def wait_time(self):
+        # seconds until the debt is paid off
+        self._refill()
+        if not self.rate or self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class BandwidthGovernor():
+    '''
+    process wide bandwidth limit, every download draws from it
+
+    total_limit is shared by everything downloading at the moment and
+    job_limit applies to each job on its own (a playlist is one job), both
+    in bytes per second with 0 for no limit. both can be changed while
+    downloads are running, they slow down or speed up right away
+
+    downloads are throttled from their yt-dlp progress hook (see
+    wrap_progress_hook), the thread that reports progress sleeps until
+    the bytes it just read are paid for
+    '''
+    def __init__(self, total_limit=0, job_limit=0):
+        self.total_limit = total_limit
+        self.job_limit = job_limit
+        self._total = TokenBucket(total_limit)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def set_limits(self, total_limit=None, job_limit=None):
+        with self._lock:
+            if total_limit is not None:
+                self.total_limit = max(0, int(total_limit))
+                self._total.set_rate(self.total_limit)
+            if job_limit is not None:
+                self.job_limit = max(0, int(job_limit))
+                for bucket in self._jobs.values():
+                    bucket.set_rate(self.job_limit)
+
+    @property
+    def limited(self):
+        return bool(self.total_limit or self.job_limit)
+
+    def _job_bucket(self, job):
+        bucket = self._jobs.get(job)
+        if bucket is None:
+            now = time.monotonic()
+            for key in [key for key, old in self._jobs.items() if now - old.last_used > idle_bucket_age]:
+                del self._jobs[key]
+            bucket = self._jobs[job] = TokenBucket(self.job_limit)
+        return bucket
+
+    def throttle(self, job, amount, should_stop=None):
+        '''
+        counts amount bytes against job and blocks until the limits allow
+        them, returns the seconds spent waiting. should_stop() ends the wait early
+        '''
+        if amount <= 0 or not self.limited:
+            return 0.0
+
+        with self._lock:
+            self._total.take(amount)
+            self._job_bucket(job).take(amount)
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                wait = max(self._total.wait_time(), self._job_bucket(job).wait_time())
+            if wait <= 0 or (should_stop is not None and should_stop()):
+                return waited
+            step = min(wait, throttle_step)
+            time.sleep(step)
+            waited += step
+
+    def wrap_progress_hook(self, progress_hook, job, should_stop=None):
+        # a yt-dlp progress hook that throttles before passing the event on
+        last_bytes = {}
+
+        def on_progress(d):
+            if d.get('status') == "downloading":
+                filename = d.get('filename')
+                downloaded = d.get('downloaded_bytes') or 0
+                # the first report of a file may include what a resumed download already had
+                previous = last_bytes.get(filename)
+                last_bytes[filename] = downloaded
+                if previous is not None and downloaded > previous:
+                    waited = self.throttle(job, downloaded - previous, should_stop)
+                    if waited:
+                        count("throttled_seconds", waited)
+            progress_hook(d)
+
+        return on_progress
+
+
+# the one governor every download in this process shares
+bandwidth_governor = BandwidthGovernor()
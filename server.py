@@ -0,0 +1,515 @@
+'''
+long running HTTP/JSON front end, for clients that share one process
+(warm yt-dlp instances, the search and thumbnail caches and one download
+queue) instead of each running the GUI
+
+    python server.py --port 8765
+    python server.py --host 0.0.0.0 --output /srv/downloads
+
+    GET    /search?q=...&max_results=10   search results
+    GET    /video?url=...                 title, channel, duration and resolution choices
+    GET    /thumbnail?url=...&key=...     preview JPEG, key is the video id
+    GET    /jobs                          every queued download
+    POST   /jobs                          {"url", "kind", "title", "priority", "video_format"}
+    GET    /jobs/<id>                     one download with its latest progress
+    POST   /jobs/<id>/pause|resume|cancel
+    DELETE /jobs/<id>
+    GET    /jobs/<id>/events              progress as server-sent events
+    GET    /events                        progress of every download as server-sent events
+    GET    /limits, POST /limits          {"max_concurrent", "bandwidth_limit", "job_bandwidth_limit"}
+    GET    /health
+
+downloads go through the same persistent queue the GUI uses, kinds are
+mp3, audio, mp4, playlist-mp3, playlist-audio and playlist-mp4. the GUI
+can run on the same directory at the same time, each job still runs in
+only one of them. files land in --output, clients can not pick a
+directory. video and job urls must be youtube links and thumbnail urls
+ytimg/ggpht ones, so the server never fetches anything else. there is no
+authentication, only bind to a network you trust
+'''
+import argparse
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import urlparse, parse_qs
+
+from lazy_imports import lazy_module
+from progress import progress_bus
+from queue_manager import get_queue_manager, queue_job_key, queue_actions
+from thumbnail_cache import get_thumbnail_cache, preview_size
+from yt_searcher import search_youtube, get_video_info, get_video_formats, search_cache_stats, ydl_pool
+
+logger = logging.getLogger("yt_searcher.server")
+
+requests = lazy_module("requests")
+Image = lazy_module("PIL.Image")
+
+default_host = "127.0.0.1"
+default_port = 8765
+default_output_path = os.path.join(os.path.dirname(__file__), "Downloads_ytdlp")
+
+# how often (seconds) the queue starts waiting jobs, enqueueing wakes it up sooner
+pump_interval = 1.0
+
+# an SSE comment goes out this often (seconds) so idle streams are not closed by proxies
+sse_keepalive = 15
+
+max_search_results = 50
+
+# request bodies bigger than this are refused
+max_body_bytes = 64 * 1024
+
+# the server only fetches from these, so clients can not make it request anything else
+video_hosts = ("youtube.com", "youtu.be", "youtube-nocookie.com")
+thumbnail_hosts = ("ytimg.com", "ggpht.com", "googleusercontent.com")
+
+# progress statuses after which a job's event stream ends
+final_statuses = ("finished", "error", "cancelled")
+
+# how often (seconds) a job's event stream checks the queue, for jobs that end without a final event
+job_check_interval = 1.0
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _check_host(url, hosts, name="url"):
+    # the host or one of its subdomains, over http(s)
+    parsed = urlparse(url if isinstance(url, str) else "")
+    host = (parsed.hostname or "").lower()
+    if parsed.scheme not in ("http", "https") or not any(host == allowed or host.endswith(f".{allowed}")
+                                                         for allowed in hosts):
+        raise ApiError(400, f"{name} must be a {' or '.join(hosts)} link")
+
+
+class YtService():
+    '''
+    what the endpoints do, kept apart from the HTTP handling
+
+    one queue manager runs every download, a background thread polls its
+    scheduler and starts waiting jobs the way the GUI's after() loop does
+    '''
+    def __init__(self, output_dir=default_output_path):
+        self.output_dir = output_dir
+        self.queue = get_queue_manager(output_dir)
+        self.thumbnails = get_thumbnail_cache()
+        self._session = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._pump_thread = None
+
+    def start(self):
+        self._pump_thread = threading.Thread(target=self._pump, name="queue-pump", daemon=True)
+        self._pump_thread.start()
+
+    def _pump(self):
+        while not self._stop.is_set():
+            try:
+                self.queue.scheduler.poll()
+                self.queue.pump()
+            except Exception as e:
+                logger.exception(f"Error running the download queue: {e}")
+            self._wake.wait(pump_interval)
+            self._wake.clear()
+
+    def shutdown(self):
+        self._stop.set()
+        self._wake.set()
+        self.queue.shutdown()
+        if self._session is not None:
+            self._session.close()
+
+    @property
+    def session(self):
+        # made on the first thumbnail, requests is not needed before that
+        if self._session is None:
+            self._session = requests.Session()
+        return self._session
+
+    def search(self, query, max_results=10):
+        if not query.strip():
+            raise ApiError(400, "q is required")
+        max_results = min(max(1, max_results), max_search_results)
+        return {'query': query, 'results': search_youtube(query, max_results=max_results) or []}
+
+    def video(self, url):
+        if not url:
+            raise ApiError(400, "url is required")
+        _check_host(url, video_hosts)
+        try:
+            info = get_video_info(url)
+            formats = get_video_formats(url)
+        except Exception as e:
+            raise ApiError(502, f"Could not get video info: {e}")
+
+        return {
+            'id': info.get('id'),
+            'url': info.get('webpage_url') or url,
+            'title': info.get('title'),
+            'channel': info.get('channel') or info.get('uploader'),
+            'duration': info.get('duration'),
+            'thumbnail': info.get('thumbnail'),
+            'formats': formats,
+        }
+
+    def thumbnail(self, url, key=None):
+        # the downloads page preview size, shared with the GUI through the cache
+        key = key or url
+        if not key:
+            raise ApiError(400, "url or key is required")
+
+        img = self.thumbnails.get(key, "preview")
+        if img is None:
+            if not url:
+                raise ApiError(404, "Thumbnail is not cached")
+            _check_host(url, thumbnail_hosts)
+            try:
+                response = self.session.get(url, timeout=5)
+                response.raise_for_status()
+                img = Image.open(BytesIO(response.content)).convert("RGB").resize(preview_size)
+            except Exception as e:
+                raise ApiError(502, f"Could not get thumbnail: {e}")
+            self.thumbnails.put(key, "preview", img)
+
+        data = BytesIO()
+        img.convert("RGB").save(data, "JPEG", quality=85)
+        return data.getvalue()
+
+    def job(self, job_id):
+        job = self.queue.store.get(job_id)
+        if job is None:
+            raise ApiError(404, f"No job {job_id}")
+        return self.describe_job(job)
+
+    def describe_job(self, job):
+        job = dict(job)
+        job['progress'] = self.queue.latest_progress(job['id']) if job['state'] == "running" else None
+        return job
+
+    def jobs(self):
+        return {'jobs': [self.describe_job(job) for job in self.queue.jobs()]}
+
+    def enqueue(self, body):
+        url = body.get('url')
+        if not url or not isinstance(url, str):
+            raise ApiError(400, "url is required")
+        _check_host(url, video_hosts)
+
+        kind = body.get('kind', "mp3")
+        if kind not in queue_actions:
+            raise ApiError(400, f"kind must be one of {', '.join(queue_actions)}")
+        for name in ('title', 'video_format'):
+            if body.get(name) is not None and not isinstance(body[name], str):
+                raise ApiError(400, f"{name} must be a string")
+        priority = body.get('priority') or 0
+        if not isinstance(priority, int) or isinstance(priority, bool):
+            raise ApiError(400, "priority must be a whole number")
+
+        try:
+            job_id = self.queue.enqueue(url, kind, self.output_dir, title=body.get('title'), priority=priority,
+                                        options={'video_format': body.get('video_format')})
+        except ValueError as e:
+            raise ApiError(400, str(e))
+
+        self._wake.set()
+        return self.job(job_id)
+
+    def job_action(self, job_id, action):
+        self.job(job_id)
+        actions = {'pause': self.queue.pause, 'resume': self.queue.resume, 'cancel': self.queue.cancel}
+        actions[action](job_id)
+        self._wake.set()
+        return self.job(job_id)
+
+    def remove(self, job_id):
+        self.job(job_id)
+        self.queue.remove(job_id)
+        return {'removed': job_id}
+
+    def limits(self):
+        return {
+            'max_concurrent': self.queue.max_concurrent,
+            'bandwidth_limit': self.queue.bandwidth_limit,
+            'job_bandwidth_limit': self.queue.job_bandwidth_limit,
+        }
+
+    def set_limits(self, body):
+        try:
+            if body.get('max_concurrent') is not None:
+                self.queue.set_max_concurrent(int(body['max_concurrent']))
+            if body.get('bandwidth_limit') is not None or body.get('job_bandwidth_limit') is not None:
+                self.queue.set_bandwidth_limit(body.get('bandwidth_limit'), body.get('job_bandwidth_limit'))
+        except (TypeError, ValueError) as e:
+            raise ApiError(400, str(e))
+
+        self._wake.set()
+        return self.limits()
+
+    def health(self):
+        return {
+            'ok': True,
+            'search_cache': search_cache_stats(),
+            'ydl_pool': {'created': ydl_pool.created, 'reused': ydl_pool.reused},
+            'thumbnail_cache': self.thumbnails.stats(),
+            'running': len(self.queue.running),
+        }
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    # set on the class by make_server
+    service = None
+
+    routes = (
+        ("GET", r"/search", "get_search"),
+        ("GET", r"/video", "get_video"),
+        ("GET", r"/thumbnail", "get_thumbnail"),
+        ("GET", r"/jobs", "get_jobs"),
+        ("POST", r"/jobs", "post_jobs"),
+        ("GET", r"/jobs/(\d+)", "get_job"),
+        ("DELETE", r"/jobs/(\d+)", "delete_job"),
+        ("POST", r"/jobs/(\d+)/(pause|resume|cancel)", "post_job_action"),
+        ("GET", r"/jobs/(\d+)/events", "get_job_events"),
+        ("GET", r"/events", "get_events"),
+        ("GET", r"/limits", "get_limits"),
+        ("POST", r"/limits", "post_limits"),
+        ("GET", r"/health", "get_health"),
+    )
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    # no route takes these, they get a JSON 405 (or 404) instead of the base class's HTML 501
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_PATCH(self):
+        self.dispatch("PATCH")
+
+    def do_OPTIONS(self):
+        self.dispatch("OPTIONS")
+
+    def dispatch(self, method):
+        parsed = urlparse(self.path)
+        self.query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        path = parsed.path.rstrip("/") or "/"
+
+        try:
+            allowed = False
+            for route_method, pattern, name in self.routes:
+                match = re.fullmatch(pattern, path)
+                if not match:
+                    continue
+                allowed = True
+                if route_method == method:
+                    return getattr(self, name)(*match.groups())
+            if allowed:
+                raise ApiError(405, f"{method} is not allowed on {path}")
+            raise ApiError(404, f"Nothing at {path}")
+        except ApiError as e:
+            self.send_json({'error': e.message}, e.status)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            logger.exception(f"Error handling {method} {self.path}: {e}")
+            self.send_json({'error': str(e)}, 500)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > max_body_bytes:
+            raise ApiError(413, "Request body is too big")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise ApiError(400, "Request body must be JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Request body must be a JSON object")
+        return body
+
+    def int_param(self, name, default):
+        try:
+            return int(self.query.get(name, default))
+        except ValueError:
+            raise ApiError(400, f"{name} must be a number")
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def get_search(self):
+        self.send_json(self.service.search(self.query.get('q', ""), self.int_param('max_results', 10)))
+
+    def get_video(self):
+        self.send_json(self.service.video(self.query.get('url')))
+
+    def get_thumbnail(self):
+        data = self.service.thumbnail(self.query.get('url'), self.query.get('key'))
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "max-age=86400")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def get_jobs(self):
+        self.send_json(self.service.jobs())
+
+    def post_jobs(self):
+        self.send_json(self.service.enqueue(self.read_json()), 201)
+
+    def get_job(self, job_id):
+        self.send_json(self.service.job(int(job_id)))
+
+    def delete_job(self, job_id):
+        self.send_json(self.service.remove(int(job_id)))
+
+    def post_job_action(self, job_id, action):
+        self.send_json(self.service.job_action(int(job_id), action))
+
+    def get_limits(self):
+        self.send_json(self.service.limits())
+
+    def post_limits(self):
+        self.send_json(self.service.set_limits(self.read_json()))
+
+    def get_health(self):
+        self.send_json(self.service.health())
+
+    def get_job_events(self, job_id):
+        job = self.service.job(int(job_id))
+        key = queue_job_key(job['id'])
+
+        # a job that is not running has nothing to stream, its state is the only event
+        if job['state'] != "running" and job['state'] != "queued":
+            self.stream_events(None, first=[{'job': key, 'status': job['state'], 'state': job['state'],
+                                             'error': job['error']}])
+            return
+
+        def final_state():
+            # a job can fail before it publishes anything, the queue still knows
+            current = self.service.queue.store.get(job['id'])
+            if current is None or current['state'] not in ("queued", "running"):
+                state = current['state'] if current else "removed"
+                return {'job': key, 'status': state, 'state': state, 'error': current and current['error']}
+            return None
+
+        latest = progress_bus.latest(key)
+        self.stream_events(lambda event: event.get('job') == key or event.get('parent') == key,
+                           first=[latest] if latest else [], until=key, final_state=final_state)
+
+    def get_events(self):
+        self.stream_events(lambda event: True)
+
+    def stream_events(self, wanted, first=(), until=None, final_state=None):
+        '''
+        server-sent events until the client goes away, or until job until
+        reaches a final status. wanted=None sends only the first events.
+        final_state() is asked every job_check_interval, whatever it returns
+        is sent as the last event
+        '''
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(event):
+            self.wfile.write(f"data: {json.dumps(event, default=str)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            return until is not None and event.get('job') == until and event.get('status') in final_statuses
+
+        for event in first:
+            if send(event):
+                return
+        if wanted is None:
+            return
+
+        events = queue.Queue()
+
+        def on_event(event):
+            if wanted(event):
+                events.put(event)
+
+        progress_bus.subscribe(on_event)
+        try:
+            idle = 0.0
+            while True:
+                try:
+                    event = events.get(timeout=job_check_interval)
+                except queue.Empty:
+                    last = final_state() if final_state is not None else None
+                    if last is not None:
+                        send(last)
+                        return
+                    idle += job_check_interval
+                    if idle >= sse_keepalive:
+                        idle = 0.0
+                        self.wfile.write(b": keepalive\n\n")
+                        self.wfile.flush()
+                    continue
+                idle = 0.0
+                if send(event):
+                    return
+        finally:
+            progress_bus.unsubscribe(on_event)
+
+    def log_message(self, format, *args):
+        # SSE streams are logged when they start, not only once they end
+        logger.info(f"{self.address_string()} {format % args}")
+
+
+def make_server(service, host=default_host, port=default_port):
+    handler = type("BoundApiHandler", (ApiHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Search and download over a local HTTP/JSON API")
+    parser.add_argument("--host", default=default_host, help="address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=default_port, help="port to listen on (default 8765)")
+    parser.add_argument("-o", "--output", default=default_output_path, help="download directory")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    service = YtService(args.output)
+    service.start()
+    server = make_server(service, args.host, args.port)
+    logger.info(f"Listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
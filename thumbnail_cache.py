@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import os
+import threading
+
+from lazy_imports import lazy_module
+
+logger = logging.getLogger("yt_searcher.thumbnails")
+
+Image = lazy_module("PIL.Image")
+
+default_cache_dir = os.path.join(os.path.dirname(__file__), "thumbnail_cache")
+
+# 100 MB of already resized thumbnails
+default_max_bytes = 100 * 1024 * 1024
+
+# size of the downloads page preview, the search tile size is set by the search page
+preview_size = (350, 200)
+
+
+class ThumbnailCache():
+    '''
+    keeps resized thumbnails on disk, one JPEG per (key, variant)
+
+    the key is the video id (or the thumbnail url when there is no id).
+    file mtimes are bumped on every hit so the least recently used files
+    are removed first once the cache grows past max_bytes
+    '''
+    def __init__(self, cache_dir=default_cache_dir, max_bytes=default_max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key, variant):
+        digest = hashlib.sha1(str(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}_{variant}.jpg")
+
+    def _entries(self):
+        # (path, size, last used) for every cached file
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".jpg"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def get(self, key, variant):
+        if not key:
+            return None
+
+        path = self._path(key, variant)
+        try:
+            img = Image.open(path)
+            img.load()
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return img
+
+    def put(self, key, variant, img):
+        if not key:
+            return
+
+        path = self._path(key, variant)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+
+        try:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            img.convert("RGB").save(temp_path, "JPEG", quality=85)
+            os.replace(temp_path, path)
+            new_size = os.path.getsize(path)
+        except OSError as e:
+            logger.warning(f"Error caching thumbnail: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        with self._lock:
+            self.total_bytes += new_size - old_size
+            over = self.total_bytes > self.max_bytes
+
+        if over:
+            self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[2])
+            total = sum(size for _, size, _ in entries)
+
+            # oldest first until we are back under the limit
+            for path, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+            self.total_bytes = total
+
+    def clear(self):
+        with self._lock:
+            for path, _, _ in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_thumbnail_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ThumbnailCache()
+        return _cache
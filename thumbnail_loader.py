@@ -0,0 +1,118 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from thumbnail_cache import preview_size
+from lazy_imports import lazy_module
+
+requests = lazy_module("requests")
+requests_adapters = lazy_module("requests.adapters")
+Image = lazy_module("PIL.Image")
+ImageOps = lazy_module("PIL.ImageOps")
+
+default_max_workers = 6
+
+
+class ThumbnailLoader():
+    '''
+    fetches, decodes and resizes thumbnails on a pool of worker threads
+
+    all requests share one pooled requests.Session so connections to the
+    thumbnail host are kept alive. finished images are put on a queue that
+    the GUI drains with poll(), PhotoImages must still be made on the Tk thread
+
+    when a ThumbnailCache is given, tiles are served from disk when possible
+    and every download also stores the downloads page preview
+    '''
+    def __init__(self, max_workers=default_max_workers, cache=None):
+        self.cache = cache
+        self.session = requests.Session()
+        adapter = requests_adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thumbnail")
+        self.results = queue.Queue()
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def load(self, items, size, border=0, border_fill=None, reset=True, wanted=None):
+        '''
+        items is a list of (index, url, cache key), with reset every call
+        starts a new generation so results from an older search are thrown
+        away, without it the items are added to the current one
+
+        wanted(index) is asked again right before an item is fetched, items
+        it turns down come back from poll() with neither an image nor an error
+        '''
+        with self._lock:
+            if reset:
+                self.generation += 1
+            generation = self.generation
+
+        for index, url, key in items:
+            self.executor.submit(self._fetch, generation, index, url, key, size, border, border_fill, wanted)
+
+        return generation
+
+    def cancel(self):
+        # anything still in flight becomes stale
+        with self._lock:
+            self.generation += 1
+
+    def _fetch(self, generation, index, url, key, size, border, border_fill, wanted=None):
+        if generation != self.generation:
+            return
+
+        # it scrolled out of view while waiting for a worker
+        if wanted is not None and not wanted(index):
+            self.results.put((generation, index, None, None))
+            return
+
+        try:
+            key = key or url
+            if self.cache is not None:
+                img = self.cache.get(key, "tile")
+                if img is not None:
+                    self.results.put((generation, index, img, None))
+                    return
+
+            if not url:
+                raise ValueError("No thumbnail url")
+
+            response = self.session.get(url, timeout=5)
+            response.raise_for_status()
+
+            original = Image.open(BytesIO(response.content)).convert("RGB")
+            img = original.resize(size)
+
+            if border:
+                img = ImageOps.expand(img, border=border, fill=border_fill)
+
+            if self.cache is not None:
+                self.cache.put(key, "tile", img)
+                self.cache.put(key, "preview", original.resize(preview_size))
+
+            self.results.put((generation, index, img, None))
+        except Exception as e:
+            self.results.put((generation, index, None, e))
+
+    def poll(self):
+        # returns (index, image, error) for everything finished in the current generation
+        finished = []
+        while True:
+            try:
+                generation, index, img, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            if generation == self.generation:
+                finished.append((index, img, error))
+
+        return finished
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False)
+        self.session.close()
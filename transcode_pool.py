@@ -0,0 +1,90 @@
+import os
+import platform
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# ffmpeg audio encoder for each target format
+audio_encoders = {
+    'mp3': 'libmp3lame',
+    'm4a': 'aac',
+    'aac': 'aac',
+    'opus': 'libopus',
+}
+
+
+def ffmpeg_binary(ffmpeg_location=None):
+    # the bundled ffmpeg if we have one, otherwise whatever is on the PATH
+    name = "ffmpeg.exe" if platform.system() == "Windows" else "ffmpeg"
+    if ffmpeg_location:
+        path = os.path.join(ffmpeg_location, name)
+        if os.path.exists(path):
+            return path
+    return name
+
+
+def transcode_file(source, target, ffmpeg_path, codec="mp3", quality="192", remove_source=True):
+    # runs inside a worker process, so it only uses plain arguments
+    temp_target = f"{target}.transcoding{os.path.splitext(target)[1]}"
+    command = [
+        ffmpeg_path, '-y', '-loglevel', 'error',
+        '-i', source,
+        '-vn',
+        '-c:a', audio_encoders.get(codec, codec),
+        '-b:a', f"{quality}k",
+        temp_target,
+    ]
+
+    try:
+        subprocess.run(command, check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        if os.path.exists(temp_target):
+            os.remove(temp_target)
+        raise RuntimeError(f"ffmpeg failed on {source}: {e.stderr.decode(errors='replace').strip()}")
+
+    os.replace(temp_target, target)
+    if remove_source:
+        os.remove(source)
+    return target
+
+
+class TranscodePool():
+    '''
+    ffmpeg post processing in a separate pool of processes, one per core by default
+
+    downloads land raw in a staging folder and are handed to submit(), so the
+    next download can already be on the network while this one is encoding
+    '''
+    def __init__(self, max_workers=None, ffmpeg_location=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.ffmpeg_path = ffmpeg_binary(ffmpeg_location)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # worker processes are only started the first time something is transcoded
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def submit(self, source, target, codec="mp3", quality="192", remove_source=True):
+        return self._get_executor().submit(transcode_file, source, target, self.ffmpeg_path,
+                                           codec, quality, remove_source)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_transcode_pool(ffmpeg_location=None):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = TranscodePool(ffmpeg_location=ffmpeg_location)
+        return _pool
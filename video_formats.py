@@ -0,0 +1,111 @@
+from progress import format_bytes
+
+# what download_video used before formats could be picked, still the default
+default_max_height = 720
+
+
+def format_for_height(max_height=None):
+    '''
+    yt-dlp format selector for the best video up to max_height
+
+    a progressive mp4 is taken when there is one, otherwise the best mp4
+    video stream is merged with the m4a audio stream (DASH)
+    '''
+    h = int(max_height or default_max_height)
+    return (f"best[ext=mp4][vcodec^=avc1][height<={h}]/best[ext=mp4][height<={h}]/"
+            f"bestvideo[ext=mp4][height<={h}]+bestaudio[ext=m4a]/best[height<={h}]")
+
+
+def _has_video(fmt):
+    return fmt.get('vcodec') not in (None, 'none') and bool(fmt.get('height'))
+
+
+def _has_audio(fmt):
+    return fmt.get('acodec') not in (None, 'none')
+
+
+def estimated_size(fmt, duration=None):
+    # bytes, from the size yt-dlp reports or from the bitrate and the video length
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if not size and fmt.get('tbr') and duration:
+        size = fmt['tbr'] * 1000 / 8 * duration
+    return size
+
+
+def _best_audio(formats):
+    # m4a merges into an mp4 without re-encoding, so it goes first
+    audio = [fmt for fmt in formats if _has_audio(fmt) and fmt.get('vcodec') == 'none']
+    if not audio:
+        return None
+    return max(audio, key=lambda fmt: (fmt.get('ext') == 'm4a', fmt.get('abr') or fmt.get('tbr') or 0))
+
+
+def _pick_video(candidates, duration):
+    # avc1 mp4 plays everywhere, after that the smallest stream
+    return min(candidates, key=lambda fmt: (not (fmt.get('vcodec') or '').startswith('avc1'),
+                                            fmt.get('ext') != 'mp4',
+                                            estimated_size(fmt, duration) or float('inf')))
+
+
+def summarize_formats(info):
+    '''
+    one choice per resolution from an extracted info dict
+
+    every resolution gets either its progressive stream or a DASH video +
+    audio pair, whichever is expected to be smaller. choices are dicts with
+    a label for the GUI and a yt-dlp format selector, highest resolution first
+    '''
+    duration = info.get('duration')
+    formats = info.get('formats') or []
+    audio = _best_audio(formats)
+    audio_size = estimated_size(audio, duration) if audio else None
+
+    heights = sorted({fmt['height'] for fmt in formats if _has_video(fmt)}, reverse=True)
+    choices = []
+    for height in heights:
+        options = []
+
+        progressive = [fmt for fmt in formats if _has_video(fmt) and _has_audio(fmt) and fmt['height'] == height]
+        if progressive:
+            fmt = _pick_video(progressive, duration)
+            options.append({
+                'format_id': fmt['format_id'],
+                'vcodec': fmt.get('vcodec'),
+                'size': estimated_size(fmt, duration),
+                'dash': False,
+            })
+
+        video_only = [fmt for fmt in formats if _has_video(fmt) and not _has_audio(fmt) and fmt['height'] == height]
+        if video_only and audio:
+            fmt = _pick_video(video_only, duration)
+            video_size = estimated_size(fmt, duration)
+            options.append({
+                'format_id': f"{fmt['format_id']}+{audio['format_id']}",
+                'vcodec': fmt.get('vcodec'),
+                'size': video_size + audio_size if video_size and audio_size else None,
+                'dash': True,
+            })
+
+        if not options:
+            continue
+
+        # sizes we do not know lose, and a progressive stream wins a tie since it needs no merge
+        best = min(options, key=lambda option: (option['size'] is None, option['size'] or 0, option['dash']))
+        codec = (best['vcodec'] or "?").split(".")[0]
+        label = f"{height}p {codec}"
+        if best['size']:
+            label += f" ~{format_bytes(best['size'])}"
+        if best['dash']:
+            label += " (DASH)"
+
+        choices.append({
+            'label': label,
+            'height': height,
+            'vcodec': best['vcodec'],
+            'size': best['size'],
+            'dash': best['dash'],
+            # falls back to whatever is closest if the exact streams are gone by download time
+            'format': f"{best['format_id']}/best[height<={height}]",
+        })
+
+    return choices
@@ -0,0 +1,509 @@
+'''
+worker fleet that shares one durable queue kept in a directory
+
+    python worker.py submit /mnt/share/queue urls.txt -k playlist-mp3 -o /mnt/share/music
+    python worker.py run /mnt/share/queue --processes 4
+    python worker.py status /mnt/share/queue
+
+the queue directory can be shared between hosts (NFS/SMB), every job is
+one JSON file that moves between pending/, running/, done/ and failed/.
+claiming a job is a rename from pending/ to running/, only one worker can
+win it. a worker touches the files of its running jobs every
+heartbeat_interval seconds, and a running job whose file has not been
+touched for lease_timeout seconds belongs to a crashed worker, any worker
+puts it back in pending/ (or in failed/ after max_attempts)
+
+playlist jobs are split up, the worker that claims one lists the playlist
+and submits one job per video, so a large playlist is spread over the
+whole fleet. the items end up where download_playlist would put them, and
+splitting the same playlist again only adds the items that are missing. the hosts' clocks should agree to well within lease_timeout
+'''
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import uuid
+
+from instrumentation import count
+from progress import progress_bus
+from queue_manager import queue_actions, queue_options
+
+logger = logging.getLogger("yt_searcher.worker")
+
+queue_dirs = ("pending", "running", "done", "failed")
+
+# seconds between heartbeats, and after how long without one a job is taken back
+heartbeat_interval = 10
+lease_timeout = 120
+
+# tries before a job ends up in failed/
+max_attempts = 3
+
+# how long (seconds) an idle worker waits before looking for jobs again
+idle_interval = 2.0
+
+# every worker looks for jobs of crashed workers this often (seconds)
+reap_interval = 30
+
+# the single video kind each playlist kind is split into
+playlist_item_kinds = {
+    'playlist-mp3': 'mp3',
+    'playlist-audio': 'audio',
+    'playlist-mp4': 'mp4',
+}
+
+# the audio mode of each single video kind when it is a playlist item
+item_audio_modes = {
+    'mp3': "mp3",
+    'audio': "original",
+    'mp4': None,
+}
+
+max_priority = 999
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue():
+    '''
+    the queue directory, every method is safe to call from many processes
+    on many hosts at once as long as rename is atomic on the file system
+
+    file names start with the inverted priority and the submit time, so
+    listing pending/ in name order gives the order jobs should run in
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        for name in queue_dirs:
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    def _path(self, state, name):
+        return os.path.join(self.directory, state, name)
+
+    def _write(self, path, job):
+        # a reader never sees half a file
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, indent=1)
+        os.replace(temp_path, path)
+
+    def _rewrite(self, path, job):
+        # in place, FileNotFoundError once another worker moved the file away. _write would
+        # bring a job a reaper took back to life and two workers would run it
+        with open(path, "r+", encoding="utf-8") as f:
+            f.truncate()
+            json.dump(job, f, indent=1)
+
+    def _read(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def names(self, state):
+        return sorted(name for name in os.listdir(os.path.join(self.directory, state)) if name.endswith(".json"))
+
+    def exists(self, job_id):
+        return any(os.path.exists(self._path(state, f"{job_id}.json")) for state in queue_dirs)
+
+    def submit(self, url, kind, output_dir, title=None, priority=0, options=None, parent=None,
+               job_id=None, playlist=None, video_id=None):
+        # job_id is for jobs that must only be queued once, nothing is written when it exists already
+        if kind not in queue_actions:
+            raise ValueError(f"Unknown download kind: {kind}")
+
+        options = {key: value for key, value in (options or {}).items() if value is not None}
+        unknown = set(options) - set(queue_options)
+        if unknown:
+            raise ValueError(f"Unknown download options: {', '.join(sorted(unknown))}")
+
+        priority = min(max(-max_priority, int(priority)), max_priority)
+        if job_id is None:
+            job_id = f"{max_priority - priority:04d}-{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        elif self.exists(job_id):
+            return job_id
+        job = {
+            'id': job_id,
+            'url': url,
+            'kind': kind,
+            'output_dir': os.path.abspath(output_dir),
+            'title': title,
+            'priority': priority,
+            'options': options,
+            'parent': parent,
+            'playlist': playlist,
+            'video_id': video_id,
+            'attempts': 0,
+            'created_at': time.time(),
+        }
+        # written outside pending/ first so no worker claims a half written job
+        temp_path = self._path("pending", f"{job_id}.json.tmp")
+        self._write(temp_path, job)
+        os.rename(temp_path, self._path("pending", f"{job_id}.json"))
+        return job_id
+
+    def claim(self, worker):
+        # the first pending job this worker wins the rename of, or None
+        for name in self.names("pending"):
+            running_path = self._path("running", name)
+            try:
+                os.rename(self._path("pending", name), running_path)
+                # the file still has the mtime of its submit, a reaper would take it straight back
+                os.utime(running_path)
+                job = self._read(running_path)
+                job['worker'] = worker
+                job['claimed_at'] = time.time()
+                job['attempts'] = job.get('attempts', 0) + 1
+                self._rewrite(running_path, job)
+            except FileNotFoundError:
+                # another worker got it, or a reaper took it back in between
+                continue
+            return job
+        return None
+
+    def heartbeat(self, job):
+        # False once the job is no longer ours (a reaper took it back)
+        try:
+            os.utime(self._path("running", f"{job['id']}.json"))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _finish(self, job, state, **fields):
+        running_path = self._path("running", f"{job['id']}.json")
+        if not os.path.exists(running_path):
+            return False
+
+        job = {**job, **fields, 'finished_at': time.time()}
+        try:
+            self._rewrite(running_path, job)
+            os.rename(running_path, self._path(state, f"{job['id']}.json"))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def complete(self, job, result=None):
+        return self._finish(job, "done", result=result, error=None)
+
+    def fail(self, job, error):
+        # back in line until it has used up its attempts
+        state = "failed" if job.get('attempts', 0) >= max_attempts else "pending"
+        return self._finish(job, state, error=str(error))
+
+    def release(self, job):
+        # handed back untouched, like when a worker shuts down
+        return self._finish(job, "pending", attempts=max(0, job.get('attempts', 1) - 1))
+
+    def reap(self, timeout=lease_timeout):
+        # running jobs whose worker stopped sending heartbeats go back to pending, returns their ids
+        reaped = []
+        now = time.time()
+        for name in self.names("running"):
+            running_path = self._path("running", name)
+            try:
+                if now - os.path.getmtime(running_path) < timeout:
+                    continue
+                job = self._read(running_path)
+            except FileNotFoundError:
+                continue
+            except ValueError:
+                job = None
+
+            if job is None:
+                # its worker died halfway through rewriting it, only the id in the name is left
+                state = "failed"
+                job = {'id': name[:-len(".json")], 'error': "Job file was left unreadable by a worker that stopped",
+                       'finished_at': now}
+            else:
+                state = "failed" if job.get('attempts', 0) >= max_attempts else "pending"
+                job['error'] = f"Lease of {job.get('worker')} expired"
+            # claim it for reaping first so two reapers can not both move it
+            reaping_path = f"{running_path}.{uuid.uuid4().hex}.reaping"
+            try:
+                os.rename(running_path, reaping_path)
+            except FileNotFoundError:
+                continue
+            self._write(reaping_path, job)
+            os.rename(reaping_path, self._path(state, name))
+            reaped.append(job['id'])
+        return reaped
+
+    def retry_failed(self):
+        retried = []
+        for name in self.names("failed"):
+            failed_path = self._path("failed", name)
+            try:
+                job = self._read(failed_path)
+            except (FileNotFoundError, ValueError):
+                continue
+            if 'url' not in job:
+                # what reap kept of an unreadable job file, there is nothing to run again
+                continue
+            job['attempts'] = 0
+            try:
+                self._rewrite(failed_path, job)
+                os.rename(failed_path, self._path("pending", name))
+            except FileNotFoundError:
+                continue
+            retried.append(job['id'])
+        return retried
+
+    def jobs(self, state):
+        jobs = []
+        for name in self.names(state):
+            try:
+                jobs.append(self._read(self._path(state, name)))
+            except (FileNotFoundError, ValueError):
+                continue
+        return jobs
+
+    def counts(self):
+        return {state: len(self.names(state)) for state in queue_dirs}
+
+
+class Worker():
+    '''
+    claims jobs from a WorkQueue and runs them with yt_search, threads
+    jobs at a time. stop() lets the running downloads stop at their next
+    progress report and hands their jobs back to the queue
+    '''
+    def __init__(self, work_queue, threads=1, name=None):
+        self.queue = work_queue
+        self.threads = threads
+        self.name = name or worker_id()
+        self.running = {}
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def run(self):
+        heartbeat_thread = threading.Thread(target=self._heartbeats, name="heartbeat", daemon=True)
+        heartbeat_thread.start()
+
+        workers = [threading.Thread(target=self._work, name=f"worker-{n}") for n in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+    def stop(self):
+        self._stopping.set()
+        with self._lock:
+            jobs = list(self.running.values())
+        for job in jobs:
+            progress_bus.cancel(self.job_key(job))
+
+    def job_key(self, job):
+        return f"worker:{job['id']}"
+
+    def _work(self):
+        while not self._stopping.is_set():
+            job = self.queue.claim(self.name)
+            if job is None:
+                self._stopping.wait(idle_interval)
+                continue
+
+            with self._lock:
+                self.running[job['id']] = job
+            try:
+                self._run_job(job)
+            finally:
+                with self._lock:
+                    self.running.pop(job['id'], None)
+                progress_bus.uncancel(self.job_key(job))
+
+    def _heartbeats(self):
+        last_reap = 0.0
+        while not self._stopping.wait(heartbeat_interval):
+            with self._lock:
+                jobs = list(self.running.values())
+            for job in jobs:
+                if not self.queue.heartbeat(job):
+                    # reaped while it was still running here, someone else may run it now
+                    logger.warning(f"Lost the lease of {job['id']}, stopping it")
+                    progress_bus.cancel(self.job_key(job))
+
+            if time.monotonic() - last_reap >= reap_interval:
+                last_reap = time.monotonic()
+                try:
+                    for job_id in self.queue.reap():
+                        logger.warning(f"Took back {job_id} from a worker that stopped")
+                except OSError as e:
+                    logger.error(f"Error reaping jobs: {e}")
+
+    def _run_job(self, job):
+        try:
+            if job['kind'] in playlist_item_kinds:
+                result = self._split_playlist(job)
+            else:
+                result = self._download(job)
+        except Exception as e:
+            result, error = None, e
+        else:
+            error = None if result else self._error(job)
+
+        if self._stopping.is_set() and error:
+            self.queue.release(job)
+            count("worker_jobs", outcome="released")
+        elif error:
+            self.queue.fail(job, error)
+            count("worker_jobs", outcome="failed")
+        else:
+            self.queue.complete(job, result)
+            count("worker_jobs", outcome="done")
+
+    def _error(self, job):
+        # the download functions publish why they failed instead of raising
+        event = progress_bus.latest(self.job_key(job)) or {}
+        return event.get('error') or "Download failed"
+
+    def _download(self, job):
+        # imported here so submit and status work without yt_dlp installed
+        from yt_searcher import yt_search, download_playlist_item
+
+        options = {key: value for key, value in job.get('options', {}).items() if key in queue_options}
+        if job.get('playlist') is not None:
+            entry = {'url': job['url'], 'id': job.get('video_id'), 'title': job.get('title')}
+            audio_mode = item_audio_modes[job['kind']]
+            return download_playlist_item(entry, job['output_dir'], job['playlist'],
+                                          audio_only=audio_mode is not None, audio_mode=audio_mode,
+                                          job_key=self.job_key(job), **options)
+
+        searcher = yt_search(url=job['url'], title=job.get('title'), path=job['output_dir'],
+                             job_key=self.job_key(job), **options)
+        result = getattr(searcher, queue_actions[job['kind']])()
+        if not result:
+            return None
+        return result if isinstance(result, (str, dict)) else True
+
+    def _split_playlist(self, job):
+        from yt_searcher import get_playlist_entries
+
+        playlist_title, entries = get_playlist_entries(job['url'])
+        if not entries:
+            raise Exception("Playlist has no videos")
+
+        item_ids = []
+        for position, entry in enumerate(entries, 1):
+            url = entry.get('url') or entry.get('webpage_url')
+            if not url:
+                continue
+            # the same ids every time, a split that is run again after a reap skips what is queued
+            item_ids.append(self.queue.submit(url, playlist_item_kinds[job['kind']], job['output_dir'],
+                                              title=entry.get('title'), priority=job.get('priority', 0),
+                                              options=job.get('options'), parent=job['id'],
+                                              job_id=f"{job['id']}-{position:05d}",
+                                              playlist=playlist_title, video_id=entry.get('id')))
+        return {'playlist': playlist_title, 'items': len(item_ids)}
+
+
+def run_worker(directory, threads):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(processName)s %(name)s: %(message)s")
+    worker = Worker(WorkQueue(directory), threads=threads)
+
+    def on_signal(signum, frame):
+        logger.info(f"{worker.name} stopping, running jobs go back to the queue")
+        worker.stop()
+
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+    logger.info(f"{worker.name} working on {directory}")
+    worker.run()
+
+
+def read_lines(paths):
+    lines = []
+    for path in paths:
+        f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+        try:
+            lines.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+        finally:
+            if f is not sys.stdin:
+                f.close()
+    return lines
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run downloads on a fleet of workers sharing a queue directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="add urls to the queue")
+    submit.add_argument("queue", help="queue directory")
+    submit.add_argument("inputs", nargs="+", help="files with one url per line, - for stdin")
+    submit.add_argument("-k", "--kind", choices=sorted(queue_actions), default="mp3")
+    submit.add_argument("-o", "--output", required=True, help="download directory, as the workers see it")
+    submit.add_argument("-p", "--priority", type=int, default=0, help="higher runs first")
+    submit.add_argument("--max-height", type=int, default=None, help="highest video resolution for mp4")
+
+    run = commands.add_parser("run", help="work on the queue until stopped")
+    run.add_argument("queue", help="queue directory")
+    run.add_argument("--processes", type=int, default=1, help="worker processes on this host")
+    run.add_argument("--threads", type=int, default=1, help="jobs each process runs at once")
+
+    status = commands.add_parser("status", help="count the jobs in every state")
+    status.add_argument("queue", help="queue directory")
+    status.add_argument("--failed", action="store_true", help="list the failed jobs with their errors")
+
+    reap = commands.add_parser("reap", help="take back jobs of workers that stopped sending heartbeats")
+    reap.add_argument("queue", help="queue directory")
+
+    retry = commands.add_parser("retry", help="move every failed job back to pending")
+    retry.add_argument("queue", help="queue directory")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == "run":
+        WorkQueue(args.queue)
+        if args.processes <= 1:
+            run_worker(args.queue, args.threads)
+            return 0
+
+        processes = [multiprocessing.Process(target=run_worker, args=(args.queue, args.threads))
+                     for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+
+        def on_signal(signum, frame):
+            # passed on, the children hand their jobs back and exit
+            for process in processes:
+                if process.is_alive():
+                    os.kill(process.pid, signum)
+
+        signal.signal(signal.SIGINT, on_signal)
+        signal.signal(signal.SIGTERM, on_signal)
+        for process in processes:
+            process.join()
+        return 0
+
+    work_queue = WorkQueue(args.queue)
+    if args.command == "submit":
+        options = {}
+        if args.max_height:
+            from video_formats import format_for_height
+            options['video_format'] = format_for_height(args.max_height)
+        for url in read_lines(args.inputs):
+            print(work_queue.submit(url, args.kind, args.output, priority=args.priority, options=options))
+    elif args.command == "status":
+        print(json.dumps(work_queue.counts()))
+        if args.failed:
+            for job in work_queue.jobs("failed"):
+                print(f"{job['id']}  {job.get('url')}  {job.get('error')}")
+    elif args.command == "reap":
+        for job_id in work_queue.reap():
+            print(job_id)
+    elif args.command == "retry":
+        for job_id in work_queue.retry_failed():
+            print(job_id)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
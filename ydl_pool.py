@@ -0,0 +1,147 @@
+import json
+import logging
+import threading
+from contextlib import contextmanager
+
+from lazy_imports import lazy_module
+
+logger = logging.getLogger("yt_searcher.ydl_pool")
+
+yt_dlp = lazy_module("yt_dlp")
+
+# idle instances kept around for each profile/options combination
+default_max_idle = 4
+
+
+class _HookSlot():
+    # the hooks of whoever is borrowing the instance right now
+    def __init__(self):
+        self.progress_hook = None
+        self.postprocessor_hook = None
+
+    def on_progress(self, d):
+        hook = self.progress_hook
+        if hook is not None:
+            hook(d)
+
+    def on_postprocessor(self, d):
+        hook = self.postprocessor_hook
+        if hook is not None:
+            hook(d)
+
+
+def _options_key(profile, ydl_opts):
+    # outtmpl changes with every video, so it is set on the instance instead of being part of the key
+    opts = {key: value for key, value in ydl_opts.items() if key != 'outtmpl'}
+    return profile, json.dumps(opts, sort_keys=True, default=repr)
+
+
+class YoutubeDLPool():
+    '''
+    reuses yt_dlp.YoutubeDL instances instead of building one per call
+
+    instances are kept per profile (search, metadata, audio, video, playlist)
+    and options, so extractors, cookie jars and keep-alive connections stay
+    warm. a YoutubeDL is not thread safe, so borrow() hands each instance to
+    one caller at a time and takes it back when the with block ends
+
+    every instance is built with one progress hook and one postprocessor
+    hook that forward to whatever hooks the current borrower passed in
+    '''
+    def __init__(self, max_idle=default_max_idle):
+        self.max_idle = max_idle
+        self.created = 0
+        self.reused = 0
+        self._idle = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def borrow(self, profile, ydl_opts, progress_hook=None, postprocessor_hook=None):
+        key = _options_key(profile, ydl_opts)
+
+        with self._lock:
+            idle = self._idle.get(key)
+            ydl = idle.pop() if idle else None
+            if ydl is None:
+                self.created += 1
+            else:
+                self.reused += 1
+
+        if ydl is None:
+            slot = _HookSlot()
+            ydl = yt_dlp.YoutubeDL({
+                **ydl_opts,
+                'progress_hooks': [slot.on_progress],
+                'postprocessor_hooks': [slot.on_postprocessor],
+            })
+            with self._lock:
+                self._slots[id(ydl)] = slot
+
+        if 'outtmpl' in ydl_opts:
+            self._set_outtmpl(ydl, ydl_opts['outtmpl'])
+
+        slot = self._slots[id(ydl)]
+        slot.progress_hook = progress_hook
+        slot.postprocessor_hook = postprocessor_hook
+
+        try:
+            yield ydl
+        finally:
+            slot.progress_hook = None
+            slot.postprocessor_hook = None
+            self._give_back(key, ydl)
+
+    def _set_outtmpl(self, ydl, outtmpl):
+        # YoutubeDL normalizes outtmpl into a dict of templates, 'default' is the one used for downloads
+        templates = ydl.params.get('outtmpl')
+        if isinstance(templates, dict):
+            templates['default'] = outtmpl
+        else:
+            ydl.params['outtmpl'] = {'default': outtmpl}
+
+    def _give_back(self, key, ydl):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(ydl)
+                return
+
+        # the pool is full, close this one
+        self._close(ydl)
+
+    def _close(self, ydl):
+        with self._lock:
+            self._slots.pop(id(ydl), None)
+
+        try:
+            ydl.__exit__(None, None, None)
+        except Exception as e:
+            logger.warning(f"Error closing YoutubeDL: {e}")
+
+    def clear(self):
+        with self._lock:
+            idle = [ydl for instances in self._idle.values() for ydl in instances]
+            self._idle.clear()
+
+        for ydl in idle:
+            self._close(ydl)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'idle': sum(len(instances) for instances in self._idle.values()),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_ydl_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = YoutubeDLPool()
+        return _pool
@@ -1,7 +1,77 @@
-import yt_dlp
 import os
+import copy
+import itertools
+import logging
+import time
 import platform
 import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+from download_scheduler import get_scheduler
+from caches import LRUCache, SearchCache
+from rate_limits import HostRateLimiter, bandwidth_governor
+from download_index import get_download_index
+from transcode_pool import get_transcode_pool
+from lazy_imports import lazy_module
+from ydl_pool import get_ydl_pool
+from progress import progress_bus, make_hooks, DownloadCancelled
+from video_formats import summarize_formats, format_for_height
+from instrumentation import span, count, stage_hooks
+
+logger = logging.getLogger("yt_searcher")
+
+# yt_dlp is slow to import, it is only loaded the first time it is used
+yt_dlp = lazy_module("yt_dlp")
+
+# warm YoutubeDL instances, borrowed per call instead of built per call
+ydl_pool = get_ydl_pool()
+
+# full extractor results keyed by video id, format urls expire so keep them short lived
+metadata_cache = LRUCache(max_items=256, ttl=30 * 60)
+
+# resolution choices per video id, the list of formats changes far less often than their urls
+format_cache = LRUCache(max_items=256, ttl=6 * 60 * 60)
+
+# the light weight entries search_youtube already fetched, keyed by video id
+search_entry_cache = LRUCache(max_items=1024)
+
+# whole searches, so pressing search again for the same thing is instant
+search_cache = SearchCache(disk_dir=os.path.join(os.path.dirname(__file__), "search_cache"))
+
+# how many of the top search results get their metadata and formats fetched ahead of time
+prefetch_count = 3
+
+# playlist items download in parallel, the id keeps two videos with the same title apart
+playlist_item_template = '%(title)s [%(id)s].%(ext)s'
+
+# playlist items downloaded at the same time, and how hard we hit one host
+playlist_max_workers = 4
+playlist_max_per_host = 4
+playlist_min_interval = 0.5
+
+# how downloads are fetched, the download pages change these at runtime
+download_settings = {
+    'concurrent_fragments': 4,
+    'resumable': True,
+    # videos are fetched at this height or below unless a format was picked
+    'max_height': 720,
+    # mp3 encoding happens in a separate process pool instead of inline
+    'background_transcode': True,
+    # "mp3" re-encodes audio, "original" keeps the stream youtube sends (m4a/opus) as it is
+    'audio_mode': 'mp3',
+    'playlist_audio_mode': 'original',
+}
+
+audio_modes = ("mp3", "original")
+
+# raw audio waits here until it has been transcoded
+staging_dirname = ".staging"
+
+# unfinished downloads older than this are not picked up again
+pending_max_age = 3 * 24 * 60 * 60
+
+# yt_search options a pending download is resumed with, a different format would not continue its .part files
+pending_options = ('concurrent_fragments', 'ratelimit', 'video_format')
 
 def get_ffmpeg_location():
     system = platform.system()
@@ -16,23 +86,99 @@ def get_ffmpeg_location():
     else:
         raise RuntimeError("Unsupported OS")
     
-def search_youtube(query, max_results=10):
+def search_youtube(query, max_results=10, use_cache=True):
     # Search YouTube and return the first result's info.
+    if use_cache:
+        cached = search_cache.get(query, max_results)
+        count("search_cache", result="hit" if cached is not None else "miss")
+        if cached is not None:
+            remember_search_entries(cached)
+            return cached if cached else None
+
     ydl_opts = {
         'quiet': True,
         'skip_download': True,
         'extract_flat': 'in_playlist'
     }
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with span("search") as search_span, ydl_pool.borrow("search", ydl_opts) as ydl:
             info = ydl.extract_info(f"ytsearch{max_results}:{query}", download=False)
             init_entries = info.get('entries', [])
             entries = extract_video_info(init_entries)
+            search_span.set(query=query, results=len(entries))
+
+            remember_search_entries(entries)
+
+            if use_cache:
+                search_cache.put(query, max_results, entries)
+
             return entries if entries else None
     except Exception as e:
-        print(f"Error searching for {query}: {e}")
+        logger.error(f"Error searching for {query}: {e}")
         return None
 
+def iter_search_pages(query, page_size=10, max_results=500):
+    '''
+    yields lists of up to page_size results, youtube is only asked for more
+    results when the next page is actually requested
+    '''
+    skip = 0
+
+    # the first page is usually already in the search cache
+    first_page = search_cache.get(query, page_size)
+    if first_page is not None:
+        remember_search_entries(first_page)
+        if first_page:
+            yield first_page
+        if len(first_page) < page_size:
+            return
+        skip = len(first_page)
+
+    ydl_opts = {
+        'quiet': True,
+        'skip_download': True,
+        'extract_flat': 'in_playlist'
+    }
+    try:
+        with ydl_pool.borrow("search", ydl_opts) as ydl:
+            # process=False leaves the entries as yt-dlp's lazy generator, nothing is fetched yet
+            info = ydl.extract_info(f"ytsearch{max_results}:{query}", download=False, process=False)
+            entries = itertools.islice(info.get('entries') or [], skip, None)
+
+            # the first fetch is the actual search request, like search_youtube's span
+            span_name = "search"
+            while True:
+                # only the fetch is timed, not the time the caller spends on a page
+                with span(span_name) as page_span:
+                    page = extract_video_info(itertools.islice(entries, page_size))
+                    page_span.set(query=query, results=len(page))
+                span_name = "search_page"
+                if not page:
+                    return
+
+                remember_search_entries(page)
+                if skip == 0:
+                    search_cache.put(query, page_size, page)
+                    skip = len(page)
+
+                yield page
+    except Exception as e:
+        logger.error(f"Error searching for {query}: {e}")
+        return
+
+def next_search_page(pages):
+    # next page from iter_search_pages, or None once there are no more results
+    return next(pages, None)
+
+def remember_search_entries(entries):
+    # remember what we already know so clicking a result does not extract it again
+    for entry in entries:
+        if entry.get('id'):
+            search_entry_cache.put(entry['id'], entry)
+
+def search_cache_stats():
+    return search_cache.stats()
+
 def extract_video_info(data_list):
     result = []
     for item in data_list:
@@ -42,6 +188,7 @@ def extract_video_info(data_list):
         
         # append into dictionary of one search tiem
         result.append({
+            'id': item.get('id'),
             'url': item.get('url'),
             'title': item.get('title'),
             'channel': item.get('channel'),
@@ -51,15 +198,260 @@ def extract_video_info(data_list):
     # return the list of dictionaries
     return result
 
-def download_audio(url_link, output_dir=None):    
+def video_id_from_url(url_link):
+    # pull the video id out of the common youtube url shapes, without going to the network
+    if not url_link:
+        return None
+
+    parsed = urlparse(url_link)
+    host = parsed.netloc.lower()
+
+    if host.endswith("youtu.be"):
+        return parsed.path.strip("/").split("/")[0] or None
+
+    if "youtube" in host:
+        video_ids = parse_qs(parsed.query).get("v")
+        if video_ids:
+            return video_ids[0]
+
+        # /shorts/<id>, /embed/<id>, /live/<id>
+        parts = [part for part in parsed.path.split("/") if part]
+        if len(parts) == 2 and parts[0] in ("shorts", "embed", "live", "v"):
+            return parts[1]
+
+    return None
+
+def get_video_info(url_link):
+    # extract a video once, later calls for the same video come from the cache
+    key = video_id_from_url(url_link) or url_link
+    info = metadata_cache.get(key)
+    count("metadata_cache", result="hit" if info is not None else "miss")
+    if info is not None:
+        return info
+
+    ydl_opts = {
+        'quiet': True,
+        'skip_download': True,
+    }
+    with span("metadata") as metadata_span, ydl_pool.borrow("metadata", ydl_opts) as ydl:
+        metadata_span.set(url=url_link)
+        # process=False keeps the raw extractor result so it can be handed
+        # straight to process_ie_result when we actually download
+        info = ydl.extract_info(url_link, download=False, process=False)
+
+    metadata_cache.put(key, info)
+    if info.get('id') and info['id'] != key:
+        metadata_cache.put(info['id'], info)
+    return info
+
+def get_video_formats(url_link):
+    # resolution/codec choices for one video, probed once and then cached
+    key = video_id_from_url(url_link) or url_link
+    choices = format_cache.get(key)
+    if choices is not None:
+        return choices
+
+    with span("format_probe"):
+        info = get_video_info(url_link)
+        choices = summarize_formats(info)
+    format_cache.put(key, choices)
+    if info.get('id') and info['id'] != key:
+        format_cache.put(info['id'], choices)
+    return choices
+
+def prefetch_video(url_link):
+    '''
+    fills the metadata and format caches for a video the user will
+    probably open next, so its downloads page and download start right away
+    '''
+    try:
+        get_video_formats(url_link)
+        count("prefetch", result="ok")
+        return True
+    except Exception as e:
+        count("prefetch", result="error")
+        logger.info(f"Error prefetching {url_link}: {e}")
+        return False
+
+def _video_format(video_format=None):
+    return video_format or format_for_height(download_settings['max_height'])
+
+def safe_filename(title):
+    return "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).rstrip()
+
+def _download_from_info(info, ydl_opts, profile, job=None, parent=None):
+    # download using an already extracted info dict, no second extraction
+    progress_hook, postprocessor_hook = make_hooks(progress_bus, job, parent, info.get('title'))
+    progress_hook, postprocessor_hook = stage_hooks(progress_hook, postprocessor_hook, profile=profile)
+    # a playlist shares one per job limit between its items
+    progress_hook = bandwidth_governor.wrap_progress_hook(
+        progress_hook, parent or job or info.get('id'), should_stop=lambda: progress_bus.is_cancelled(job, parent))
+    with span("download", profile=profile) as download_span, \
+            ydl_pool.borrow(profile, ydl_opts, progress_hook, postprocessor_hook) as ydl:
+        download_span.set(video_id=info.get('id'))
+        return ydl.process_ie_result(copy.deepcopy(info), download=True)
+
+def _publish(job, status, parent=None, **fields):
+    if status in ("finished", "error", "cancelled"):
+        outcome = "skipped" if fields.get('skipped') else status
+        count("downloads", outcome=outcome, level="item" if parent is not None else "job")
+
+    if job is not None:
+        progress_bus.publish({'job': job, 'parent': parent, 'status': status, **fields})
+
+def _is_resumable(resumable=None):
+    if resumable is None:
+        return download_settings['resumable']
+    return bool(resumable)
+
+def _transfer_options(concurrent_fragments=None, resumable=None, ratelimit=None):
+    if concurrent_fragments is None:
+        concurrent_fragments = download_settings['concurrent_fragments']
+    resumable = _is_resumable(resumable)
+
+    options = {
+        # DASH/HLS fragments are fetched over several connections at once
+        'concurrent_fragment_downloads': max(1, int(concurrent_fragments)),
+        # keep the .part file and continue it after a crash or restart
+        'continuedl': bool(resumable),
+        'nopart': False,
+        'retries': 10,
+        'fragment_retries': 10,
+        'skip_unavailable_fragments': False,
+    }
+    if ratelimit:
+        # bytes per second for this one download
+        options['ratelimit'] = int(ratelimit)
+    return options
+
+def _use_background_transcode(background_transcode=None):
+    if background_transcode is None:
+        return download_settings['background_transcode']
+    return bool(background_transcode)
+
+def _audio_mode(audio_mode=None, playlist=False):
+    mode = audio_mode or download_settings['playlist_audio_mode' if playlist else 'audio_mode']
+    if mode not in audio_modes:
+        raise ValueError(f"Unknown audio mode: {mode}")
+    return mode
+
+def _audio_format(audio_mode):
+    # what the download index and the pending list call each audio mode
+    return "mp3" if audio_mode == "mp3" else "audio"
+
+def _original_audio_options():
+    # the audio stream is only remuxed into its own container (m4a/opus), never re-encoded
+    return {
+        'format': 'bestaudio[ext=m4a]/bestaudio/best',
+        'postprocessors': [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': 'best',
+        }],
+    }
+
+def _download_raw_audio(info, staging_dir, transfer_options, job=None, parent=None):
+    # fetch the audio stream as is, the transcode pool turns it into an mp3 later
+    video_id = safe_filename(info.get('id') or 'Unknown_Id') or 'Unknown_Id'
+    ydl_opts = {
+        'ffmpeg_location': get_ffmpeg_location(),
+        'format': 'bestaudio/best',
+        'outtmpl': f'{staging_dir}/{video_id}.%(ext)s',
+        'quiet': True,
+        **transfer_options,
+    }
+
+    result = _download_from_info(info, ydl_opts, "raw_audio", job, parent)
+    raw_path = _final_path(result)
+    if not raw_path:
+        raise Exception("Download finished without a file")
+    return raw_path
+
+def _final_path(result, expected_path=None):
+    # where the file ended up after post processing
+    downloads = (result or {}).get('requested_downloads') or [{}]
+    path = downloads[0].get('filepath')
+    if path and os.path.exists(path):
+        return path
+    return expected_path
+
+def _give_up_pending(output_dir, url_link, kind):
+    # a download that failed for good is not tried again on the next start, a cancelled one is
+    if output_dir is None or kind is None:
+        return
+    try:
+        get_download_index(output_dir).clear_pending(url_link, kind)
+    except Exception as e:
+        logger.error(f"Error clearing pending download: {e}")
+
+def _already_downloaded(output_dir, video_id, fmt):
+    record = get_download_index(output_dir).lookup(video_id, fmt)
+    if record:
+        logger.info(f"Already downloaded: {record['output_path']}")
+        count("downloads_skipped", format=fmt)
+    return record is not None
+
+def download_audio(url_link, output_dir=None, concurrent_fragments=None, resumable=None,
+                   background_transcode=None, job_key=None, ratelimit=None, audio_mode=None):    
+    # progress events for this download are published under job_key (the url by default)
+    job = job_key or url_link
+    fmt = None
     try:
         if output_dir == None:
             raise Exception("No Valid Path")
+
+        mode = _audio_mode(audio_mode)
+        fmt = _audio_format(mode)
+
+        # skip anything the index says we already have
+        if _already_downloaded(output_dir, video_id_from_url(url_link), fmt):
+            _publish(job, "finished", skipped=True)
+            return True
         
-        title = get_video_title(url_link)
+        info = get_video_info(url_link)
+        title = info.get('title') or 'Unknown_Title'
+        video_id = info.get('id') or url_link
+        if _already_downloaded(output_dir, video_id, fmt):
+            _publish(job, "finished", skipped=True)
+            return True
+
+        index = get_download_index(output_dir)
+        if _is_resumable(resumable):
+            index.mark_pending(url_link, fmt, {'concurrent_fragments': concurrent_fragments, 'ratelimit': ratelimit})
 
         output_path = f"{output_dir}/{title}"
 
+        if mode == "original":
+            # no ffmpeg encoding at all, convert_audio_to_mp3 can still make an mp3 later
+            ydl_opts = {
+                'ffmpeg_location': get_ffmpeg_location(),
+                'outtmpl': f'{output_path}.%(ext)s',
+                'quiet': True,
+                **_original_audio_options(),
+                **_transfer_options(concurrent_fragments, resumable, ratelimit),
+            }
+
+            result = _download_from_info(info, ydl_opts, "original_audio", job)
+            index.record(video_id, fmt, _final_path(result))
+            index.clear_pending(url_link, fmt)
+
+            _publish(job, "finished")
+            return True
+
+        if _use_background_transcode(background_transcode):
+            # download raw, then wait for the process pool to encode it
+            raw_path = _download_raw_audio(info, os.path.join(output_dir, staging_dirname),
+                                           _transfer_options(concurrent_fragments, resumable, ratelimit), job)
+            # ffmpeg gets a real path, not an outtmpl, so the title has to be a valid file name
+            mp3_target = os.path.join(output_dir, f"{yt_dlp.utils.sanitize_filename(title)}.mp3")
+            future = get_transcode_pool(get_ffmpeg_location()).submit(raw_path, mp3_target)
+            _publish(job, "postprocessing", phase="transcode")
+            with span("transcode", codec="mp3"):
+                mp3_path = future.result()
+            index.record(video_id, "mp3", mp3_path)
+            index.clear_pending(url_link, "mp3")
+            _publish(job, "finished")
+            return True
+
         # Download audio from a YouTube URL using yt-dlp
         ydl_opts = {
             'ffmpeg_location': get_ffmpeg_location(), 
@@ -71,108 +463,392 @@ def download_audio(url_link, output_dir=None):
                 'preferredquality': '192',
             }],
             'quiet': True,  
+            **_transfer_options(concurrent_fragments, resumable, ratelimit),
         }
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url_link])
+        result = _download_from_info(info, ydl_opts, "audio", job)
+        index.record(video_id, "mp3", _final_path(result, f"{output_path}.mp3"))
+        index.clear_pending(url_link, "mp3")
+
+        _publish(job, "finished")
+        return True
 
+    except DownloadCancelled as e:
+        logger.warning(f"{e}")
+        _publish(job, "cancelled")
+        return False
     except yt_dlp.utils.DownloadError as e:
-        print(f"{e}")
-        return
+        logger.error(f"{e}")
+        _give_up_pending(output_dir, url_link, fmt)
+        _publish(job, "error", error=str(e))
+        return False
     except Exception as e:
-        print(f"{e}")
-        return
+        logger.exception(f"{e}")
+        _give_up_pending(output_dir, url_link, fmt)
+        _publish(job, "error", error=str(e))
+        return False
     
-def download_video(url_link, output_dir=None):    
+def download_video(url_link, output_dir=None, concurrent_fragments=None, resumable=None, job_key=None,
+                   ratelimit=None, video_format=None):    
+    # progress events for this download are published under job_key (the url by default)
+    job = job_key or url_link
     try:
         if output_dir == None:
             raise Exception("No Valid Path")
+
+        # skip anything the index says we already have
+        if _already_downloaded(output_dir, video_id_from_url(url_link), "mp4"):
+            _publish(job, "finished", skipped=True)
+            return True
         
-        title = get_video_title(url_link)
-        safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).rstrip()
+        info = get_video_info(url_link)
+        video_id = info.get('id') or url_link
+        if _already_downloaded(output_dir, video_id, "mp4"):
+            _publish(job, "finished", skipped=True)
+            return True
+
+        index = get_download_index(output_dir)
+        if _is_resumable(resumable):
+            index.mark_pending(url_link, "mp4", {'concurrent_fragments': concurrent_fragments, 'ratelimit': ratelimit,
+                                                 'video_format': video_format})
+
+        # downloads land on the _init name first and are renamed once complete
+        safe_title = safe_filename(info.get('title') or 'Unknown_Title')
         output_path = f"{output_dir}/{safe_title}_init"
 
         ydl_opts = {
             'ffmpeg_location': get_ffmpeg_location(),
-            'format': 'best[ext=mp4][vcodec^=avc1][height<=720]/best[ext=mp4][height<=720]', 
+            # a choice from get_video_formats, or the best mp4 up to max_height
+            'format': _video_format(video_format), 
             'outtmpl': f'{output_path}.%(ext)s',  
             'merge_output_format': 'mp4', 
+            **_transfer_options(concurrent_fragments, resumable, ratelimit),
         }
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url_link])
+        result = _download_from_info(info, ydl_opts, "video", job)
+        path = _final_path(result, f"{output_path}.mp4")
+
+        final_path = os.path.join(output_dir, safe_title + os.path.splitext(path)[1])
+        if os.path.exists(path) and not os.path.exists(final_path):
+            os.replace(path, final_path)
+            path = final_path
 
+        index.record(video_id, "mp4", path)
+        index.clear_pending(url_link, "mp4")
+
+        _publish(job, "finished")
+        return True
+
+    except DownloadCancelled as e:
+        logger.warning(f"{e}")
+        _publish(job, "cancelled")
+        return False
     except yt_dlp.utils.DownloadError as e:
-        print(f"{e}")
-        return
+        logger.error(f"{e}")
+        _give_up_pending(output_dir, url_link, "mp4")
+        _publish(job, "error", error=str(e))
+        return False
     except Exception as e:
-        print(f"{e}")
-        return
+        logger.exception(f"{e}")
+        _give_up_pending(output_dir, url_link, "mp4")
+        _publish(job, "error", error=str(e))
+        return False
+
+def is_playlist(url):
+    # check if its a playlist
+    playlist_indicators = [
+        "list=",  
+        "playlist",  
+        "/playlist/",  
+        "&list=" 
+    ]
+
+    return any(indicator in url.lower() for indicator in playlist_indicators)
+
+def get_playlist_entries(url_link):
+    # flat extraction only lists the videos, nothing is resolved yet
+    ydl_opts = {
+        'quiet': True,
+        'skip_download': True,
+        'extract_flat': 'in_playlist'
+    }
+    with ydl_pool.borrow("playlist", ydl_opts) as ydl:
+        info = ydl.extract_info(url_link, download=False)
+    if info.get('_type') != 'playlist':
+        raise Exception("Not a playlist")
+
+    playlist_title = info.get('title') or info.get('id') or 'Unknown_Playlist'
+    entries = [entry for entry in (info.get('entries') or []) if entry]
+    return playlist_title, entries
+
+def _playlist_entry_id(entry):
+    url_link = entry.get('url') or entry.get('webpage_url')
+    return entry.get('id') or video_id_from_url(url_link) or url_link
+
+def _download_playlist_item(entry, playlist_dir, audio_only, transfer_options, background_transcode, parent=None,
+                            video_format=None, audio_mode="mp3"):
+    # returns the finished path, or a future when the mp3 is still being encoded
+    url_link = entry.get('url') or entry.get('webpage_url')
+    info = get_video_info(url_link)
+
+    if audio_only and audio_mode == "original":
+        ydl_opts = {
+            'ffmpeg_location': get_ffmpeg_location(),
+            'outtmpl': f'{playlist_dir}/{playlist_item_template}',
+            'quiet': True,
+            **_original_audio_options(),
+            **transfer_options,
+        }
+        return _final_path(_download_from_info(info, ydl_opts, "original_audio", url_link, parent))
+
+    if audio_only and background_transcode:
+        raw_path = _download_raw_audio(info, os.path.join(playlist_dir, staging_dirname), transfer_options,
+                                       url_link, parent)
+        _publish(url_link, "postprocessing", parent, phase="transcode")
+        title = yt_dlp.utils.sanitize_filename(info.get('title') or 'Unknown_Title')
+        video_id = yt_dlp.utils.sanitize_filename(info.get('id') or 'Unknown_Id')
+        return get_transcode_pool(get_ffmpeg_location()).submit(
+            raw_path, os.path.join(playlist_dir, f"{title} [{video_id}].mp3"))
+
+    if audio_only:
+        format_str = 'bestaudio/best'
+        postprocessors = [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': 'mp3',
+            'preferredquality': '192',
+        }]
+    else:
+        format_str = _video_format(video_format)
+        postprocessors = []
+
+    ydl_opts = {
+        'ffmpeg_location': get_ffmpeg_location(), 
+        'format': format_str,  
+        'outtmpl': f'{playlist_dir}/{playlist_item_template}',
+        'postprocessors': postprocessors,  
+        'merge_output_format': 'mp4',
+        'quiet': True,
+        **transfer_options,
+    }
 
-def download_playlist(url_link, output_dir=None, audio_only=False):
+    result = _download_from_info(info, ydl_opts, "playlist", url_link, parent)
+    return _final_path(result)
+
+def download_playlist(url_link, output_dir=None, audio_only=False, max_workers=None,
+                      max_per_host=None, min_interval=None, concurrent_fragments=None, resumable=None,
+                      background_transcode=None, job_key=None, ratelimit=None, video_format=None,
+                      audio_mode=None):
+    '''
+    downloads every video of a playlist into output_dir/<playlist title>/,
+    max_workers items at a time. video_format applies to every item, for
+    bulk jobs format_for_height() with a low height saves a lot of bandwidth.
+    audio keeps its original format unless audio_mode is "mp3"
+
+    returns a report with one entry per video, or False when the playlist
+    itself could not be read. progress of every item is published with the
+    playlist's job_key as its parent
+    '''
+    job = job_key or url_link
     try:
         if output_dir is None:
             raise Exception("No Valid Path")
-        
-        # check if its a playlist
-        def is_playlist(url):
-            playlist_indicators = [
-                "list=",  
-                "playlist",  
-                "/playlist/",  
-                "&list=" 
-            ]
-
-            return any(indicator in url.lower() for indicator in playlist_indicators)
             
         if not is_playlist(url_link): raise Exception("Not a playlist")
 
-        if audio_only:
-            format_str = 'bestaudio/best'
-            postprocessors = [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }]
-        else:
-            format_str = 'best[ext=mp4][vcodec^=avc1][height<=720]/best[ext=mp4][height<=720]'
-            postprocessors = []
+        playlist_title, entries = get_playlist_entries(url_link)
         
-        ydl_opts = {
-            'ffmpeg_location': get_ffmpeg_location(), 
-            'format': format_str,  
-            'outtmpl': f'{output_dir}/%(playlist_title)s/%(title)s.%(ext)s',
-            'postprocessors': postprocessors,  
-            'merge_output_format': 'mp4'
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        _publish(job, "error", error=str(e))
+        return False
+
+    # the same %(playlist_title)s folder as before, item names also carry the video id
+    playlist_dir = os.path.join(output_dir, yt_dlp.utils.sanitize_filename(playlist_title))
+    index = get_download_index(output_dir)
+    audio_mode = _audio_mode(audio_mode, playlist=True) if audio_only else None
+    fmt = _audio_format(audio_mode) if audio_only else "mp4"
+    kind = f"playlist-{fmt}"
+    if _is_resumable(resumable):
+        index.mark_pending(url_link, kind, {'concurrent_fragments': concurrent_fragments, 'ratelimit': ratelimit,
+                                            'video_format': None if audio_only else video_format})
+
+    transfer_options = _transfer_options(concurrent_fragments, resumable, ratelimit)
+    background_transcode = _use_background_transcode(background_transcode)
+    limiter = HostRateLimiter(max_per_host=max_per_host or playlist_max_per_host,
+                              min_interval=playlist_min_interval if min_interval is None else min_interval)
+
+    completed = itertools.count(1)
+
+    def item_done(item):
+        _publish(item['url'], "finished" if item['ok'] else "error", job,
+                 title=item['title'], skipped=item['skipped'], error=item['error'])
+        _publish(job, "playlist_progress", completed=next(completed), total=len(entries),
+                 title=playlist_title)
+
+    def run_item(position, entry):
+        item = {
+            'index': position,
+            'video_id': _playlist_entry_id(entry),
+            'url': entry.get('url') or entry.get('webpage_url'),
+            'title': entry.get('title'),
+            'ok': False,
+            'skipped': False,
+            'path': None,
+            'error': None,
         }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url_link])
-        
+        try:
+            # nothing new is started once the whole playlist is cancelled
+            if progress_bus.is_cancelled(job):
+                raise DownloadCancelled("Playlist cancelled")
+
+            # incremental syncs only fetch what is new
+            record = index.lookup(item['video_id'], fmt)
+            if record:
+                item['path'] = record['output_path']
+                item['skipped'] = True
+                item['ok'] = True
+                item_done(item)
+                return item
+
+            with limiter.limit(item['url']):
+                result = _download_playlist_item(entry, playlist_dir, audio_only, transfer_options,
+                                                 background_transcode, job, video_format, audio_mode)
+
+            if isinstance(result, Future):
+                # this worker moves on to the next download while ffmpeg runs
+                item['transcode'] = result
+                return item
+
+            item['path'] = result
+            index.record(item['video_id'], fmt, result)
+            item['ok'] = True
+        except Exception as e:
+            item['error'] = str(e)
+
+        item_done(item)
+        return item
+
+    def finish_item(item, future):
+        try:
+            item['path'] = future.result()
+            index.record(item['video_id'], fmt, item['path'])
+            item['ok'] = True
+        except Exception as e:
+            item['error'] = str(e)
+        item_done(item)
+
+    with span("playlist", format=fmt) as playlist_span:
+        with ThreadPoolExecutor(max_workers=max_workers or playlist_max_workers,
+                                thread_name_prefix="playlist") as executor:
+            items = list(executor.map(run_item, range(1, len(entries) + 1), entries))
+
+        # the last few items may still be encoding
+        with span("transcode_wait", codec=fmt):
+            for item in items:
+                future = item.pop('transcode', None)
+                if future is not None:
+                    finish_item(item, future)
+
+        playlist_span.set(playlist=playlist_title, items=len(items))
+
+    report = {
+        'playlist_title': playlist_title,
+        'total': len(items),
+        'succeeded': sum(1 for item in items if item['ok']),
+        'failed': sum(1 for item in items if not item['ok']),
+        'skipped': sum(1 for item in items if item['skipped']),
+        'items': items,
+    }
+
+    for item in items:
+        if not item['ok']:
+            logger.error(f"Error downloading {item['title'] or item['url']}: {item['error']}")
+
+    # items that failed failed for good, only a cancelled playlist is picked up again
+    if not progress_bus.is_cancelled(job):
+        index.clear_pending(url_link, kind)
+
+    if progress_bus.is_cancelled(job):
+        _publish(job, "cancelled", title=playlist_title)
+    else:
+        _publish(job, "finished", title=playlist_title, succeeded=report['succeeded'], failed=report['failed'])
+
+    return report
+
+def download_playlist_item(entry, output_dir, playlist_title, audio_only=False, concurrent_fragments=None,
+                           resumable=None, background_transcode=None, job_key=None, ratelimit=None,
+                           video_format=None, audio_mode=None):
+    '''
+    one entry of a playlist on its own, for workers that share a playlist's
+    items out. it lands in the same folder, under the same name and in the
+    same download index as download_playlist would put it
+
+    returns the finished path, raises when the download fails
+    '''
+    job = job_key or entry.get('url')
+    url_link = entry.get('url') or entry.get('webpage_url')
+    playlist_dir = os.path.join(output_dir, yt_dlp.utils.sanitize_filename(playlist_title))
+    index = get_download_index(output_dir)
+    audio_mode = _audio_mode(audio_mode, playlist=True) if audio_only else None
+    fmt = _audio_format(audio_mode) if audio_only else "mp4"
+    video_id = _playlist_entry_id(entry)
+
+    record = index.lookup(video_id, fmt)
+    if record:
+        _publish(url_link, "finished", job, title=entry.get('title'), skipped=True)
+        return record['output_path']
+
+    try:
+        result = _download_playlist_item(entry, playlist_dir, audio_only,
+                                         _transfer_options(concurrent_fragments, resumable, ratelimit),
+                                         _use_background_transcode(background_transcode), job,
+                                         video_format, audio_mode)
+        if isinstance(result, Future):
+            result = result.result()
+        if not result:
+            raise Exception("Download finished without a file")
     except Exception as e:
-        print(f"Error: {e}")
+        _publish(url_link, "error", job, title=entry.get('title'), error=str(e))
+        raise
+
+    index.record(video_id, fmt, result)
+    _publish(url_link, "finished", job, title=entry.get('title'))
+    return result
 
 def get_video_title(url_link):
     try:
-        ydl_opts = {
-            'quiet': True,
-            'skip_download': True,
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url_link, download=False)
-            title = info.get('title', 'Unknown_Title')
-            return title
+        # search results already carry the title
+        video_id = video_id_from_url(url_link)
+        if video_id:
+            entry = search_entry_cache.get(video_id)
+            if entry and entry.get('title'):
+                return entry['title']
+
+        info = get_video_info(url_link)
+        return info.get('title', 'Unknown_Title')
     except Exception as e:
-        print(f"Error getting title: {e}")
+        logger.error(f"Error getting title: {e}")
         return 'Unknown_Title'
 
 
 class yt_search():
-    def __init__(self, query=None, url=None, title=None, path=None):
+    def __init__(self, query=None, url=None, title=None, path=None,
+                 concurrent_fragments=None, resumable=None, job_key=None, ratelimit=None, video_format=None):
         self.query = query
         self.url = url
         self.title = title
         self.path = path
+
+        # None means use download_settings
+        self.concurrent_fragments = concurrent_fragments
+        self.resumable = resumable
+        self.ratelimit = ratelimit
+
+        # yt-dlp format selector for mp4 downloads, None means the best up to max_height
+        self.video_format = video_format
+
+        # progress events for this searcher's downloads use this key
+        self.job_key = job_key or url
         
         if query:
             self.results = search_youtube(query)
@@ -182,26 +858,132 @@ class yt_search():
 
     def get_results(self):
         return self.results
+
+    def iter_pages(self, page_size=10):
+        return iter_search_pages(self.query, page_size=page_size)
+
+    def get_formats(self):
+        return get_video_formats(self.url)
+    
+    def transfer_settings(self):
+        return {
+            'concurrent_fragments': self.concurrent_fragments,
+            'resumable': self.resumable,
+            'job_key': self.job_key,
+            'ratelimit': self.ratelimit,
+        }
+
+    def subscribe(self, callback):
+        # callback(event) for progress of this searcher's downloads, and of playlist items under it
+        def on_event(event):
+            if event.get('job') == self.job_key or event.get('parent') == self.job_key:
+                callback(event)
+
+        return progress_bus.subscribe(on_event)
+
+    def unsubscribe(self, subscription):
+        progress_bus.unsubscribe(subscription)
+
+    def latest_progress(self):
+        return progress_bus.latest(self.job_key)
     
     def download_mp3(self):
-        download_audio(self.url, self.path)
+        return download_audio(self.url, self.path, audio_mode="mp3", **self.transfer_settings())
+
+    def download_original_audio(self):
+        # m4a/opus as youtube sends it, no re-encoding
+        return download_audio(self.url, self.path, audio_mode="original", **self.transfer_settings())
 
     def download_mp4(self):
-        download_video(self.url, self.path)
+        return download_video(self.url, self.path, video_format=self.video_format, **self.transfer_settings())
 
     def download_link_to_mp3(self):
-        download_audio(self.url, self.path)
+        return download_audio(self.url, self.path, audio_mode="mp3", **self.transfer_settings())
 
     def download_link_to_mp4(self):
-        download_video(self.url, self.path)
+        return download_video(self.url, self.path, video_format=self.video_format, **self.transfer_settings())
 
     def download_playlist_link_to_mp3(self):
         if self.url:
-            download_playlist(self.url, self.path, audio_only=True)
+            return download_playlist(self.url, self.path, audio_only=True, audio_mode="mp3",
+                                     **self.transfer_settings())
+        return False
+
+    def download_playlist_link_to_audio(self):
+        if self.url:
+            return download_playlist(self.url, self.path, audio_only=True, audio_mode="original",
+                                     **self.transfer_settings())
+        return False
 
     def download_playlist_link_to_mp4(self):
         if self.url:
-            download_playlist(self.url, self.path, audio_only=False)
-        
+            return download_playlist(self.url, self.path, audio_only=False, video_format=self.video_format,
+                                     **self.transfer_settings())
+        return False
+
+    def submit(self, action, callback=None, scheduler=None):
+        # run one of the download methods above on the download scheduler instead of blocking
+        if scheduler is None:
+            scheduler = get_scheduler()
+
+        method = getattr(self, action)
+        return scheduler.submit(method, name=f"{action}: {self.title or self.url}", callback=callback)
+
+
+def convert_audio_to_mp3(output_dir, video_id, quality="192"):
+    '''
+    makes an mp3 of audio that was downloaded in its original format, on the
+    transcode pool. the original file stays, the returned future gives the mp3 path
+    '''
+    index = get_download_index(output_dir)
+    record = index.lookup(video_id, "audio")
+    if record is None:
+        raise ValueError(f"No original audio downloaded for {video_id}")
+
+    source = record['output_path']
+    future = get_transcode_pool(get_ffmpeg_location()).submit(
+        source, os.path.splitext(source)[0] + ".mp3", quality=quality, remove_source=False)
+
+    def record_mp3(done):
+        if done.exception() is None:
+            index.record(video_id, "mp3", done.result())
+
+    future.add_done_callback(record_mp3)
+    return future
+
+
+def resume_pending_downloads(output_dir, callback=None, scheduler=None):
+    # start again every download that was cut off by a crash or restart
+    actions = {
+        'mp3': 'download_mp3',
+        'audio': 'download_original_audio',
+        'mp4': 'download_mp4',
+        'playlist-mp3': 'download_playlist_link_to_mp3',
+        'playlist-audio': 'download_playlist_link_to_audio',
+        'playlist-mp4': 'download_playlist_link_to_mp4',
+    }
+
+    if scheduler is None:
+        scheduler = get_scheduler()
+
+    def resume(searcher, action, item):
+        # the entry only goes once the job is actually running, a crash before that keeps it.
+        # the download marks itself as pending again before it fetches anything
+        index.clear_pending(item['url'], item['kind'])
+        return getattr(searcher, action)()
+
+    index = get_download_index(output_dir)
+    jobs = []
+    for item in index.pending():
+        if item['kind'] not in actions or time.time() - item['started_at'] > pending_max_age:
+            index.clear_pending(item['url'], item['kind'])
+            continue
 
+        # the options it was started with, so it continues its own .part files
+        options = {key: value for key, value in item['options'].items() if key in pending_options}
+        searcher = yt_search(url=item['url'], path=output_dir, **options)
+        action = actions[item['kind']]
+        jobs.append(scheduler.submit(resume, searcher, action, item, name=f"{action}: {item['url']}",
+                                     callback=callback))
 
+    return jobs